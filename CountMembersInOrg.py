@@ -1,38 +1,27 @@
 #This counts all the members in the org
 
-import requests
-from arcgis.gis import GIS
-from arcgis.features import FeatureLayer, Feature
-import getpass
+import time
 
-# Initialize GIS with username and password
-print("Please enter your ArcGIS Online credentials:")
-username = input("Username: ")
-password = getpass.getpass("Password: ")
-gis = GIS("https://www.arcgis.com", username, password)
-print("Connected to ArcGIS Online using user credentials.")
+from sitescanClient import sitescan_get, iter_pages
+from concurrentFetch import run_in_pool
+from layerWriter import write_features, submit_edits
+from gisLogin import open_feature_layer
+from metrics import write_reports
+
+# Function to count an organization's members by paging through the members endpoint, so only
+# one page is held in memory however large the organization is (the API has no count-only query)
+def count_members(api_token, org_id):
+    return sum(1 for _ in iter_pages(api_token, f'/organizations/{org_id}/members', use_cache=False))
 
 # Function to retrieve member counts and organization name from Site Scan API organization
 def get_org_info(api_token, org_id):
-    print("Retrieving organization info from SiteScan...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    org_url = f'https://sitescan-api.arcgis.com/api/v2/organizations/{org_id}'
-    members_url = f'https://sitescan-api.arcgis.com/api/v2/organizations/{org_id}/members'
-
+    print(f"Retrieving organization info for {org_id} from SiteScan...")
     # Retrieve organization info
-    org_response = requests.get(org_url, headers=headers)
-    org_response.raise_for_status()
-    org_info = org_response.json()
+    org_info = sitescan_get(api_token, f'/organizations/{org_id}')
     org_name = org_info['name']
 
-    # Retrieve member count
-    members_response = requests.get(members_url, headers=headers)
-    members_response.raise_for_status()
-    members = members_response.json()
-    member_count = len(members)
+    # Count members page by page
+    member_count = count_members(api_token, org_id)
 
     print(f"Retrieved organization info: name={org_name}, member_count={member_count}.")
     return org_name, member_count
@@ -53,47 +42,60 @@ def add_field_if_not_exists(feature_layer, field_name, field_type="esriFieldType
     else:
         print(f"Field '{field_name}' already exists in the feature layer.")
 
-# Function to update the AGOL feature class with organization info
-def update_agol_feature_class(api_token, org_id, feature_layer):
-    print(f"Updating AGOL feature class for organization ID {org_id}...")
-    org_name, member_count = get_org_info(api_token, org_id)
+# Function to update the AGOL feature class with the member counts of several organizations at once.
+# max_workers organizations are counted concurrently. With history=True one row per organization is
+# appended, stamped with this run's recorded_at time, so the layer builds up a member count time series;
+# otherwise the layer keeps one row per organization, written with write_mode.
+def update_member_counts(api_token, org_ids, feature_layer, write_mode='replace', history=False, max_workers=1):
+    print(f"Updating AGOL feature class for {len(org_ids)} organizations...")
+    org_infos = run_in_pool(lambda org_id: get_org_info(api_token, org_id), org_ids, max_workers=max_workers)
     
     # Add the member_count and org_name fields if they don't exist
     add_field_if_not_exists(feature_layer, "member_count", field_type="esriFieldTypeInteger")
     add_field_if_not_exists(feature_layer, "org_name")
+    if history:
+        add_field_if_not_exists(feature_layer, "recorded_at", field_type="esriFieldTypeDate")
     
-    # Create a new feature with the organization info
-    feature = {
-        'attributes': {
+    # Create a new feature with each organization's info
+    recorded_at = int(time.time() * 1000)  # Milliseconds since epoch (UTC), shared by the whole run
+    features = []
+    for org_id, (org_name, member_count) in zip(org_ids, org_infos):
+        attributes = {
             'org_id': org_id,
             'org_name': org_name,
             'member_count': member_count
         }
-    }
+        if history:
+            attributes['recorded_at'] = recorded_at
+        features.append({'attributes': attributes})
     
-    # Delete existing features
-    feature_layer.delete_features(where="1=1")
-    print("Deleted existing features.")
-    
-    # Add the new feature
-    feature_layer.edit_features(adds=[feature])
-    print("Added new feature with organization info.")
+    if history:
+        # Earlier rows are never touched; this run's counts are only added
+        submit_edits(feature_layer, adds=features)
+        print(f"Appended {len(features)} timestamped member count rows.")
+    else:
+        # Replace or reconcile the existing features, keyed by organization ID
+        write_features(feature_layer, features, 'org_id', write_mode=write_mode)
+        print(f"Wrote {len(features)} features with organization info using '{write_mode}' mode.")
 
-# Example usage
-api_token = ''  # Replace with your actual API token
-org_id = ''  # Replace with your actual organization ID
-item_id = ""  # Replace with your actual feature layer item ID
+# Function to update the AGOL feature class with organization info
+def update_agol_feature_class(api_token, org_id, feature_layer, write_mode='replace', history=False):
+    update_member_counts(api_token, [org_id], feature_layer, write_mode=write_mode, history=history)
 
-# Debug information
-print(f"Using item ID: {item_id}")
+# Example usage
+if __name__ == "__main__":
+    api_token = ''  # Leave empty to use the cached, auto-refreshing token from tokenManager
+    org_id = ''  # Replace with your actual organization ID
+    org_ids = [org_id]  # Add more organization IDs to count several organizations at once
+    item_id = ""  # Replace with your actual feature layer item ID
+    write_mode = "upsert"  # "upsert" sends only changed features, "replace" deletes and re-adds everything, "bulk" replaces via one uploaded file
+    history = False  # True to append a timestamped row per organization instead of rewriting the layer
+    max_workers = 4  # Number of organizations counted concurrently
+    dry_run = False  # True to fetch from SiteScan but skip the ArcGIS login and write nothing
 
-feature_layer_item = gis.content.get(item_id)
-if feature_layer_item is None:
-    print(f"Feature layer item with ID {item_id} not found.")
-else:
-    print(f"Feature layer item found: {feature_layer_item.title}")
-    if not feature_layer_item.layers:
-        print(f"No layers found in item with ID {item_id}.")
-    else:
-        feature_layer = feature_layer_item.layers[0]
-        update_agol_feature_class(api_token, org_id, feature_layer)
+    try:
+        feature_layer = open_feature_layer(item_id, dry_run=dry_run)  # Logs in on first use
+        update_member_counts(api_token, org_ids, feature_layer, write_mode=write_mode, history=history, max_workers=max_workers)
+    finally:
+        # Write the metrics report when SITESCAN_METRICS_FILE is set
+        write_reports()
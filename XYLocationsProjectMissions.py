@@ -1,59 +1,35 @@
 # This gets the XY location from the first mission in each project in an org
 
-import requests
-from datetime import datetime, timezone
-from dateutil.parser import parse
-from arcgis.gis import GIS
-from arcgis.features import FeatureLayerCollection
-import getpass  # To securely get password input
-
-# Initialize GIS with username and password
-print("Please enter your ArcGIS Online credentials:")
-username = input("Username: ")
-password = getpass.getpass("Password: ")
-gis = GIS("https://www.arcgis.com", username, password)
-print("Connected to ArcGIS Online using user credentials.")
+from sitescanClient import sitescan_get, iter_pages
+from concurrentFetch import run_in_pool
+from layerWriter import write_features, write_features_streaming
+from pipeline import fan_out_iter
+from syncState import load_state, save_state, project_state
+from checkpoint import Journal, journal_path
+from timeUtils import most_recent_mission
+from spatialIndex import media_footprint
+from gisLogin import open_feature_layer
+from metrics import write_reports
 
 # Function to retrieve all projects
-def get_all_projects(api_token, org_id):
+def get_all_projects(api_token, org_id, use_cache=True):
     print("Retrieving all projects from SiteScan...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    projects_url = f'https://sitescan-api.arcgis.com/api/v2/organizations/{org_id}/projects'
-    response = requests.get(projects_url, headers=headers)
-    response.raise_for_status()
-    projects = response.json()
+    projects = sitescan_get(api_token, f'/organizations/{org_id}/projects', use_cache=use_cache)
     print(f"Retrieved {len(projects)} projects.")
     return projects
 
 # Function to retrieve all missions for a given project
-def get_all_missions(api_token, project_id):
+def get_all_missions(api_token, project_id, use_cache=True):
     print(f"Retrieving all missions for project ID {project_id}...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    missions_url = f'https://sitescan-api.arcgis.com/api/v2/projects/{project_id}/missions'
-    response = requests.get(missions_url, headers=headers)
-    response.raise_for_status()
-    missions = response.json()
+    missions = sitescan_get(api_token, f'/projects/{project_id}/missions', use_cache=use_cache)
     return missions
 
 # Function to get the first media location
-def get_first_media_location(api_token, mission_id):
+def get_first_media_location(api_token, mission_id, use_cache=True):
     print(f"Retrieving media location for mission ID {mission_id}...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    media_url = f'https://sitescan-api.arcgis.com/api/v2/missions/{mission_id}/media'
-    response = requests.get(media_url, headers=headers)
-    response.raise_for_status()
-    media = response.json()
-    if media:
-        first_media = media[0]
+    # Only a one-item page is requested instead of the mission's whole media list
+    first_media = next(iter_pages(api_token, f'/missions/{mission_id}/media', page_size=1, use_cache=use_cache), None)
+    if first_media:
         location = first_media.get('location', {})
         coordinates = location.get('coordinates', [])
         if coordinates:
@@ -62,73 +38,199 @@ def get_first_media_location(api_token, mission_id):
     print(f"No location available for mission ID {mission_id}.")
     return None, None
 
+# Function to get the mean location of all of a mission's photos, read in one pass over its media pages
+def get_mission_centroid(api_token, mission_id, use_cache=True):
+    print(f"Retrieving media centroid for mission ID {mission_id}...")
+    return media_footprint(iter_pages(api_token, f'/missions/{mission_id}/media', use_cache=use_cache)).centroid()
+
+# Returned for projects whose missions have not changed since the last incremental run
+UNCHANGED = 'unchanged'
+
+# Function to build the most recent mission feature for one project.
+# When previous (the project's entry in the sync state) is given and the mission list
+# has not changed since then, the media lookup is skipped and UNCHANGED is returned.
+# location='centroid' places the feature at the mean of all the mission's photos instead of its first photo.
+def get_most_recent_mission_feature(api_token, org_id, project, previous=None, use_cache=True, location='first'):
+    project_id = project['id']
+    project_name = project['name']
+    missions = get_all_missions(api_token, project_id, use_cache=use_cache)
+    mission_count = len(missions)  # Count the number of missions for this project
+    
+    # Find the most recent mission
+    if not missions:
+        return None
+    # Each mission's time is parsed once, straight to milliseconds since epoch (UTC)
+    mission, end_time = most_recent_mission(missions)
+    
+    if previous == project_state(mission['id'], end_time, mission_count):
+        return UNCHANGED
+    
+    if location == 'centroid':
+        latitude, longitude = get_mission_centroid(api_token, mission['id'], use_cache=use_cache)
+    else:
+        latitude, longitude = get_first_media_location(api_token, mission['id'], use_cache=use_cache)
+    mission_url = f"https://sitescan.arcgis.com/projects/{project_id}/missions/{mission['id']}"
+    
+    return {
+        'attributes': {
+            'OrgID': org_id,  # Add OrgID here
+            'project_id': project_id,
+            'project_name': project_name,
+            'mission_id': mission['id'],
+            'mission_name': mission['name'],
+            'end_time': end_time,
+            'latitude': latitude,
+            'longitude': longitude,
+            'mission_url': mission_url,
+            'ProjectCount': mission_count  # Added mission count here
+        },
+        'geometry': {
+            'x': longitude,
+            'y': latitude,
+            'spatialReference': {'wkid': 4326}
+        }
+    }
+
 # Function to get the most recent missions in an organization
-def get_most_recent_missions_in_org(api_token, org_id, feature_layer):
+# max_workers > 1 fetches that many projects concurrently; feature order still follows the project list
+# incremental=True only looks up media and writes features for projects whose missions changed since the last run
+# pipeline=True writes features in chunks while later projects are still being fetched (best with 'upsert')
+# resume=True picks up an interrupted run from its checkpoint journal instead of starting over
+# layer_key (e.g. the layer's item ID) keeps the sync state and journal of jobs writing this org to different layers apart
+def get_most_recent_missions_in_org(api_token, org_id, feature_layer, max_workers=1, write_mode='replace', incremental=False, pipeline=False,
+                                    resume=False, location='first', layer_key=None):
     print(f"Processing most recent missions for organization ID {org_id}...")
-    projects = get_all_projects(api_token, org_id)
+    previous_state = load_state(org_id, layer_key) if incremental else {}
+    projects = get_all_projects(api_token, org_id, use_cache=not incremental)
+    if incremental:
+        write_mode = 'upsert'  # Unchanged projects must keep their existing features
+    
+    # Finished projects and written chunks are journaled as they complete
+    journal_name = f"most_recent_missions_{org_id}_{layer_key}" if layer_key else f"most_recent_missions_{org_id}"
+    journal = Journal(journal_path(journal_name), resume=resume)
+    if journal.written:
+        write_mode = 'upsert'  # Features written before the interruption stay; only the rest is sent
+    on_written = journal.written_recorder('project_id')
     
-    new_features = []
+    unchanged_ids = set()
+    keep_ids = set()  # Existing features to leave alone: unchanged projects and ones already written
+    streamed_ids = set()  # Projects whose features reached the pipeline writer
+    changed_states = {}
+    unlocated_ids = set()  # Written without a location (no photos yet), so left out of the sync state
     
-    for project in projects:
-        project_id = project['id']
-        project_name = project['name']
-        missions = get_all_missions(api_token, project_id)
-        mission_count = len(missions)  # Count the number of missions for this project
+    # Function to build one project's feature, noting unchanged and already written projects instead of returning them
+    def process(project):
+        if project['id'] in journal.projects:
+            feature = journal.projects[project['id']]
+        else:
+            feature = get_most_recent_mission_feature(
+                api_token, org_id, project,
+                previous=previous_state.get(project['id']) if incremental else None,
+                use_cache=not incremental,
+                location=location
+            )
+            journal.record_project(project['id'], feature)
+        if feature == UNCHANGED:
+            unchanged_ids.add(project['id'])
+            keep_ids.add(project['id'])
+            return None
+        if feature is not None:
+            attributes = feature['attributes']
+            changed_states[project['id']] = project_state(
+                attributes['mission_id'], attributes['end_time'], attributes['ProjectCount'])
+            if attributes['latitude'] is None:
+                unlocated_ids.add(project['id'])
+            if project['id'] in journal.written:
+                keep_ids.add(project['id'])
+                return None
+        return feature
+    
+    try:
+        if pipeline:
+            # keep_ids fills in as projects are fetched; the writer only reads it once every feature is in
+            # Function to pass features on to the writer, noting which projects produced one
+            def streamed(features):
+                for feature in features:
+                    streamed_ids.add(feature['attributes']['project_id'])
+                    yield feature
+
+            reports = write_features_streaming(
+                feature_layer,
+                streamed(fan_out_iter(process, projects, max_workers=max_workers)),
+                'project_id', write_mode=write_mode, keep_keys=keep_ids, on_written=on_written
+            )
+            removed_ids = set(previous_state) - unchanged_ids - set(changed_states)
+            if not streamed_ids and (removed_ids or journal.written):
+                # The writer never ran, but projects that lost all missions still need their features removed
+                reports = write_features(feature_layer, [], 'project_id', write_mode='upsert', keep_keys=keep_ids)
+            print(f"Wrote {len(changed_states)} features using '{write_mode}' mode in pipeline mode.")
+        else:
+            features = run_in_pool(process, projects, max_workers=max_workers)
+            new_features = [feature for feature in features if feature is not None]
+            removed_ids = set(previous_state) - unchanged_ids - set(changed_states)
+            if incremental and not new_features and not removed_ids:
+                reports = []
+            elif incremental or new_features or journal.written:
+                # Replace or reconcile the existing features, keyed by project ID
+                reports = write_features(feature_layer, new_features, 'project_id', write_mode=write_mode, keep_keys=keep_ids,
+                                         on_written=on_written)
+                print(f"Wrote {len(new_features)} features using '{write_mode}' mode.")
+            else:
+                reports = []
         
-        # Find the most recent mission
-        if missions:
-            most_recent_mission = max(missions, key=lambda m: parse(m.get('endTime', m['created'])))
-            latitude, longitude = get_first_media_location(api_token, most_recent_mission['id'])
-            mission_url = f"https://sitescan.arcgis.com/projects/{project_id}/missions/{most_recent_mission['id']}"
-            
-            # Parse end time to ensure it's in UTC
-            end_time_utc = parse(most_recent_mission.get('endTime', most_recent_mission['created'])).astimezone(timezone.utc)
-            
-            feature = {
-                'attributes': {
-                    'OrgID': org_id,  # Add OrgID here
-                    'project_id': project_id,
-                    'project_name': project_name,
-                    'mission_id': most_recent_mission['id'],
-                    'mission_name': most_recent_mission['name'],
-                    'end_time': int(end_time_utc.timestamp() * 1000),  # Ensure the time is in milliseconds since epoch
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'mission_url': mission_url,
-                    'ProjectCount': mission_count  # Added mission count here
-                },
-                'geometry': {
-                    'x': longitude,
-                    'y': latitude,
-                    'spatialReference': {'wkid': 4326}
-                }
-            }
-            new_features.append(feature)
-                
-    if new_features:
-        # Delete existing features
-        feature_layer.delete_features(where="1=1")
-        print("Deleted existing features.")
+        if incremental:
+            print(f"{len(changed_states)} projects changed, {len(removed_ids)} removed, {len(unchanged_ids)} unchanged since the last run.")
+            if all(report['success'] for report in reports):
+                state = {project_id: previous_state[project_id] for project_id in unchanged_ids}
+                # Projects still without a location are looked up again next run, in case their photos arrive later
+                state.update({project_id: entry for project_id, entry in changed_states.items() if project_id not in unlocated_ids})
+                save_state(org_id, state, layer_key)
+            else:
+                print("Some writes failed; sync state not updated so the next run retries them.")
         
-        # Add new features
-        feature_layer.edit_features(adds=new_features)
-        print(f"Added {len(new_features)} new features.")
+        if all(report['success'] for report in reports):
+            journal.finish()
+        else:
+            print(f"Checkpoint kept at {journal.path}; run again with resume=True to retry only what is left.")
+    finally:
+        journal.close()
 
-# Example usage
-api_token = ''  # Replace with your actual API token
-org_id = ''  # Replace with your actual organization ID
-item_id = ""  # Replace with your actual feature layer item ID
+# Function to write the most recent mission per project from an org-wide mission catalog.
+# The catalog (missionCatalog.py, needs NumPy) is loaded from catalog_path when that file exists and is no older
+# than catalog_max_age seconds (default missionCatalog.layer_catalog_max_age),
+# otherwise every project's missions are fetched in one bulk pass; only the winning missions' media are looked up.
+def get_most_recent_missions_from_catalog(api_token, org_id, feature_layer, catalog_path=None, max_workers=1, write_mode='replace',
+                                          catalog_max_age=None):
+    from missionCatalog import layer_catalog_max_age, load_or_build_catalog
+    catalog = load_or_build_catalog(api_token, org_id, catalog_path, max_workers=max_workers,
+                                    max_age=layer_catalog_max_age if catalog_max_age is None else catalog_max_age)
+    new_features = catalog.most_recent_features(api_token, max_workers=max_workers)
+    if new_features:
+        write_features(feature_layer, new_features, 'project_id', write_mode=write_mode)
+        print(f"Wrote {len(new_features)} features from the mission catalog using '{write_mode}' mode.")
+    if catalog_path:
+        catalog.save(catalog_path)  # Keep the looked-up locations for the next run
 
-# Debug information
-print(f"Using item ID: {item_id}")
+# Example usage
+if __name__ == "__main__":
+    api_token = ''  # Leave empty to use the cached, auto-refreshing token from tokenManager
+    org_id = ''  # Replace with your actual organization ID
+    item_id = ""  # Replace with your actual feature layer item ID
+    write_mode = "upsert"  # "upsert" sends only changed features, "replace" deletes and re-adds everything, "bulk" replaces via one uploaded file
+    max_workers = 8  # Number of projects fetched concurrently (1 = sequential)
+    incremental = False  # True to only process projects whose missions changed since the last run
+    pipeline = False  # True to write features while later projects are still being fetched
+    resume = False  # True to continue an interrupted run from its checkpoint journal
+    location = 'first'  # 'first' photo or 'centroid' of all photos for each mission's point
+    catalog_path = ''  # Set to a .npz file to work from an org-wide mission catalog, refetched once it is an hour old
+    dry_run = False  # True to fetch from SiteScan but skip the ArcGIS login and write nothing
 
-feature_layer_item = gis.content.get(item_id)
-if feature_layer_item is None:
-    print(f"Feature layer item with ID {item_id} not found.")
-else:
-    print(f"Feature layer item found: {feature_layer_item.title}")
-    if not feature_layer_item.layers:
-        print(f"No layers found in item with ID {item_id}.")
-    else:
-        feature_layer = feature_layer_item.layers[0]
-        get_most_recent_missions_in_org(api_token, org_id, feature_layer)
+    try:
+        feature_layer = open_feature_layer(item_id, dry_run=dry_run)  # Logs in on first use
+        if catalog_path:
+            get_most_recent_missions_from_catalog(api_token, org_id, feature_layer, catalog_path=catalog_path, max_workers=max_workers, write_mode=write_mode)
+        else:
+            get_most_recent_missions_in_org(api_token, org_id, feature_layer, max_workers=max_workers, write_mode=write_mode, incremental=incremental, pipeline=pipeline, resume=resume, location=location, layer_key=item_id)
+    finally:
+        # Write the metrics report when SITESCAN_METRICS_FILE is set
+        write_reports()
@@ -0,0 +1,131 @@
+# Offline benchmark of the four jobs against a local mock SiteScan API and a fake feature layer
+#
+# Usage: python benchmark.py [--projects 20] [--missions 10] [--media 200] [--members 50]
+#                            [--latency 0.02] [--max-rps 100] [--max-workers 8] [--write-mode replace]
+#                            [--pipeline] [--json results.json]
+#
+# Reports wall time, SiteScan request count, bytes served, feature layer calls and peak
+# Python memory for each job, so throughput regressions and execution modes can be compared.
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from urllib.request import urlopen
+
+import metrics
+import mockSiteScan
+import responseCache
+import sitescanClient
+
+API_TOKEN = 'benchmark-token'
+
+# Function to read the mock server's request counters
+def _server_stats(base_url):
+    with urlopen(base_url.replace(mockSiteScan.API_PREFIX, '') + '/__stats') as response:
+        return json.load(response)
+
+# Function to build the four benchmark jobs: (name, fields the layer starts with, callable taking the layer)
+def build_jobs(dataset, args):
+    from CountMembersInOrg import update_agol_feature_class
+    from XYLocationsProjectMissions import get_most_recent_missions_in_org
+    from countMissionsInaProject import get_most_recent_missions_in_project
+    from getPhotoURLfromaMission import update_feature_layer_with_mission_media
+
+    org_id = dataset['org']['id']
+    project = dataset['projects'][0]
+    mission = dataset['missions'][project['id']][0]
+    return [
+        ('member_count', ['org_id'],
+         lambda layer: update_agol_feature_class(API_TOKEN, org_id, layer, write_mode=args.write_mode)),
+        ('xy_locations', [],
+         lambda layer: get_most_recent_missions_in_org(API_TOKEN, org_id, layer, max_workers=args.max_workers,
+                                                       write_mode=args.write_mode, pipeline=args.pipeline)),
+        ('project_missions', ['mission_count'],
+         lambda layer: get_most_recent_missions_in_project(API_TOKEN, project['id'], project['name'], layer,
+                                                           max_workers=args.max_workers, write_mode=args.write_mode,
+                                                           pipeline=args.pipeline)),
+        ('mission_photos', [],
+         lambda layer: update_feature_layer_with_mission_media(API_TOKEN, project['id'], mission['id'], layer,
+                                                                write_mode=args.write_mode, pipeline=args.pipeline)),
+    ]
+
+# Function to run one job and measure it
+def run_benchmark(name, fields, job, base_url, verbose=False):
+    layer = mockSiteScan.FakeFeatureLayer(fields)
+    before = _server_stats(base_url)
+    metrics.reset()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    tracemalloc.start()
+    started = time.perf_counter()
+    with output:
+        job(metrics.InstrumentedLayer(layer))
+    wall_time = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after = _server_stats(base_url)
+    return {
+        'job': name,
+        'wall_seconds': round(wall_time, 3),
+        'requests': after['requests'] - before['requests'],
+        'throttled': after['throttled'] - before['throttled'],
+        'bytes_received': after['bytes'] - before['bytes'],
+        'retries': sum(entry['retries'] for entry in metrics.snapshot()['operations']),
+        'layer_calls': len(layer.calls),
+        'features_written': len(layer.features),
+        'peak_memory_mb': round(peak / (1024 * 1024), 2),
+    }
+
+# Function to parse the command line, start the mock server and run every job
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SiteScan jobs against a local mock.")
+    parser.add_argument('--projects', type=int, default=20)
+    parser.add_argument('--missions', type=int, default=10, help="Missions per project")
+    parser.add_argument('--media', type=int, default=200, help="Photos per mission")
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every mock request")
+    parser.add_argument('--max-rps', type=int, help="Mock answers 429 above this many requests per second")
+    parser.add_argument('--max-workers', type=int, default=1)
+    parser.add_argument('--write-mode', default='replace')
+    parser.add_argument('--pipeline', action='store_true', help="Overlap fetching and writing where the job supports it")
+    parser.add_argument('--jobs', nargs='*', help="Only run these jobs")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the scripts' own output")
+    args = parser.parse_args(argv)
+
+    dataset = mockSiteScan.build_dataset(projects=args.projects, missions=args.missions,
+                                         media=args.media, members=args.members)
+
+    # The mock runs in its own process so its latency and memory stay out of the measurements
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=mockSiteScan.serve_forever,
+                                     args=(dataset, args.latency, 0, ready, args.max_rps), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{ready.get(timeout=30)}{mockSiteScan.API_PREFIX}"
+    sitescanClient.configure(api_url=base_url)
+    responseCache.enabled = False
+
+    results = []
+    try:
+        for name, fields, job in build_jobs(dataset, args):
+            if args.jobs and name not in args.jobs:
+                continue
+            result = run_benchmark(name, fields, job, base_url, args.verbose)
+            results.append(result)
+            print(f"{result['job']:18} {result['wall_seconds']:8.3f}s {result['requests']:6d} requests "
+                  f"{result['throttled']:4d} throttled "
+                  f"{result['bytes_received'] / 1024:10.1f} KiB {result['layer_calls']:4d} layer calls "
+                  f"{result['peak_memory_mb']:8.2f} MiB peak")
+    finally:
+        server.terminate()
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump({'settings': vars(args), 'results': results}, results_file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
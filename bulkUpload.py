@@ -0,0 +1,106 @@
+# Bulk write path: stream features into a GeoJSON file, upload it once as a temporary item and
+# append it to the layer in one server-side operation instead of many edit_features payloads
+
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+from layerWriter import chunked, default_chunk_size
+
+temp_item_tags = "sitescan,temporary"  # Tags on the uploaded items, to find any left behind by a crash
+
+# Function to convert an ArcGIS JSON point or polygon to GeoJSON (None when there is no location)
+def to_geojson_geometry(geometry):
+    if not geometry:
+        return None
+    if 'rings' in geometry:
+        # GeoJSON outer rings are counter-clockwise, ArcGIS ones clockwise
+        return {'type': 'Polygon', 'coordinates': [list(reversed(ring)) for ring in geometry['rings']]}
+    if geometry.get('x') is None or geometry.get('y') is None:
+        return None
+    return {'type': 'Point', 'coordinates': [geometry['x'], geometry['y']]}
+
+# Function to stream features into a GeoJSON FeatureCollection file one feature at a time.
+# Returns (feature count, attribute names in first-seen order, key_field values).
+def write_geojson(path, features, key_field):
+    count = 0
+    fields = {}
+    keys = []
+    with open(path, 'w') as geojson_file:
+        geojson_file.write('{"type": "FeatureCollection", "features": [\n')
+        for feature in features:
+            attributes = feature['attributes']
+            if count:
+                geojson_file.write(',\n')
+            geojson_file.write(json.dumps({'type': 'Feature', 'geometry': to_geojson_geometry(feature.get('geometry')),
+                                           'properties': attributes}))
+            fields.update(dict.fromkeys(attributes))
+            keys.append(attributes.get(key_field))
+            count += 1
+        geojson_file.write('\n]}\n')
+    return count, list(fields), keys
+
+# Function to check whether the layer accepts appends from uploaded GeoJSON
+def supports_bulk(feature_layer):
+    properties = feature_layer.properties
+    formats = str(properties.get('supportedAppendFormats', '')).lower()
+    return bool(properties.get('supportsAppend')) and 'geojson' in formats
+
+# Function to upload a GeoJSON file as a temporary item, append it to the layer mapping each
+# field to the attribute of the same name, and delete the item again. Returns True on success.
+def append_file(feature_layer, path, fields):
+    gis = feature_layer._gis
+    item = gis.content.add(
+        {'title': f"sitescan-bulk-{uuid.uuid4().hex}", 'type': 'GeoJson', 'tags': temp_item_tags},
+        data=path
+    )
+    try:
+        result = feature_layer.append(
+            item_id=item.id,
+            upload_format='geojson',
+            field_mappings=[{'name': name, 'sourceName': name} for name in fields],
+            rollback=True  # All or nothing, so a failed append never leaves a partial load
+        )
+    finally:
+        try:
+            item.delete()
+        except Exception as error:
+            print(f"Warning: could not delete temporary item {item.id} ({error!r}); remove it by hand.")
+    return result[0] if isinstance(result, tuple) else bool(result)
+
+# Function to replace the features matching where with new features through one uploaded file.
+# The old features are only deleted once the append has succeeded, so a failure leaves the layer as it was.
+# Returns a one-report list shaped like layerWriter.submit_edits' reports.
+def bulk_replace(feature_layer, features, key_field, where="1=1", on_written=None):
+    report = {'chunk': 1, 'adds': 0, 'updates': 0, 'deletes': 0,
+              'attempts': 1, 'failed': 0, 'success': False, 'error': None}
+    directory = tempfile.mkdtemp(prefix="sitescan-bulk-")
+    try:
+        path = os.path.join(directory, "features.geojson")
+        count, fields, keys = write_geojson(path, features, key_field)
+        if not count:
+            print("No features to upload; layer left unchanged.")
+            report['success'] = True
+            return [report]
+        print(f"Uploading {count} features ({os.path.getsize(path) / 1024:.0f} KiB) for a bulk append...")
+        old_ids = feature_layer.query(where=where, return_ids_only=True).get('objectIds') or []
+        report['success'] = append_file(feature_layer, path, fields)
+        report['adds'] = count
+        if report['success']:
+            for batch in chunked(old_ids, default_chunk_size):
+                feature_layer.delete_features(deletes=",".join(str(object_id) for object_id in batch))
+            report['deletes'] = len(old_ids)
+            if on_written is not None:
+                on_written([{'attributes': {key_field: key}} for key in keys])
+        else:
+            report['failed'] = count
+    except Exception as error:
+        report['success'] = False
+        report['error'] = repr(error)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    status = "ok" if report['success'] else f"FAILED (error={report['error']})"
+    print(f"Bulk append: {report['adds']} adds, {report['deletes']} old features deleted - {status}")
+    return [report]
@@ -0,0 +1,88 @@
+# Local checkpoint journal so an interrupted org scan can be resumed
+#
+# Every finished project (with the feature built for it) and every successfully written chunk
+# is appended to a JSON-lines file as soon as it completes, from whichever worker thread finished it.
+# A resumed run replays the journal, skips the projects already fetched and does not resend
+# features already written. The journal is removed once a run completes; deleting it by hand
+# is always safe and only means the next run starts from scratch.
+
+import json
+import os
+import threading
+
+checkpoint_dir = os.environ.get(
+    "SITESCAN_CHECKPOINT_DIR",
+    os.path.join(os.path.expanduser("~"), ".sitescan", "checkpoints")
+)
+
+# Function to get the journal path for a named run (e.g. one job for one org)
+def journal_path(name):
+    return os.path.join(checkpoint_dir, f"{name}.jsonl")
+
+
+class Journal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.projects = {}  # Project ID -> feature built for it (or None / UNCHANGED)
+        self.written = set()  # Keys of features already written to the layer
+        self._lock = threading.Lock()
+        self._file = None
+        if resume:
+            self._replay()
+        elif os.path.exists(path):
+            os.remove(path)  # A fresh run never mixes with an older journal
+
+    # Function to load the entries of an earlier run, ignoring a last line cut short by a crash
+    def _replay(self):
+        if not os.path.exists(self.path):
+            print(f"No checkpoint at {self.path}; starting from scratch.")
+            return
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'project' in entry:
+                    self.projects[entry['project']] = entry.get('feature')
+                elif 'written' in entry:
+                    self.written.update(entry['written'])
+        print(f"Resuming from {self.path}: {len(self.projects)} projects fetched, {len(self.written)} features written.")
+
+    # Function to append one entry, flushed straight away so it survives the process dying
+    def _append(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a')
+            self._file.write(line)
+            self._file.flush()
+
+    # Function to record that a project has been fetched and what feature it produced
+    def record_project(self, project_id, feature):
+        self._append({'project': project_id, 'feature': feature})
+        with self._lock:
+            self.projects[project_id] = feature
+
+    # Function to return an on_written callback for layerWriter that records the written features' keys
+    def written_recorder(self, key_field):
+        def record(features):
+            keys = [feature['attributes'].get(key_field) for feature in features]
+            self._append({'written': keys})
+            with self._lock:
+                self.written.update(keys)
+        return record
+
+    # Function to close the journal file, keeping it for a later resume
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # Function to close and remove the journal once the run has completed
+    def finish(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
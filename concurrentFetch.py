@@ -0,0 +1,25 @@
+# Bounded-concurrency helper for fanning SiteScan fetches out over a thread pool
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+
+# Function to run func on every item with at most max_workers calls in flight.
+# Results come back in the same order as items. If any call raises, the
+# remaining queued calls are cancelled and the first error is re-raised.
+def run_in_pool(func, items, max_workers=1):
+    items = list(items)
+    if max_workers is None or max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(func, item) for item in items]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for index, future in enumerate(futures):
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                for pending in not_done:
+                    pending.cancel()
+                print(f"Stopping: item {index + 1} of {len(items)} failed with {future.exception()!r}.")
+                raise future.exception()
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
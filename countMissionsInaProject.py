@@ -1,45 +1,26 @@
 #This counts each mission in a project
 
-import requests
-from datetime import datetime, timezone
-from dateutil.parser import parse
-from arcgis.gis import GIS
-from arcgis.features import FeatureLayerCollection
-import getpass  # To securely get password input
-
-# Initialize GIS with username and password
-print("Please enter your ArcGIS Online credentials:")
-username = input("Username: ")
-password = getpass.getpass("Password: ")
-gis = GIS("https://www.arcgis.com", username, password)
-print("Connected to ArcGIS Online using user credentials.")
+from sitescanClient import sitescan_get, iter_pages
+from concurrentFetch import run_in_pool
+from layerWriter import write_features, write_features_streaming, query_existing_features
+from pipeline import fan_out_iter
+from timeUtils import mission_time_ms
+from spatialIndex import media_footprint
+from gisLogin import open_feature_layer
+from metrics import write_reports
 
 # Function to retrieve all missions for a given project
-def get_all_missions(api_token, project_id):
+def get_all_missions(api_token, project_id, use_cache=True):
     print(f"Retrieving all missions for project ID {project_id}...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    missions_url = f'https://sitescan-api.arcgis.com/api/v2/projects/{project_id}/missions'
-    response = requests.get(missions_url, headers=headers)
-    response.raise_for_status()
-    missions = response.json()
+    missions = sitescan_get(api_token, f'/projects/{project_id}/missions', use_cache=use_cache)
     return missions
 
 # Function to get the first media location
-def get_first_media_location(api_token, mission_id):
+def get_first_media_location(api_token, mission_id, use_cache=True):
     print(f"Retrieving media location for mission ID {mission_id}...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    media_url = f'https://sitescan-api.arcgis.com/api/v2/missions/{mission_id}/media'
-    response = requests.get(media_url, headers=headers)
-    response.raise_for_status()
-    media = response.json()
-    if media:
-        first_media = media[0]
+    # Only a one-item page is requested instead of the mission's whole media list
+    first_media = next(iter_pages(api_token, f'/missions/{mission_id}/media', page_size=1, use_cache=use_cache), None)
+    if first_media:
         location = first_media.get('location', {})
         coordinates = location.get('coordinates', [])
         if coordinates:
@@ -48,6 +29,11 @@ def get_first_media_location(api_token, mission_id):
     print(f"No location available for mission ID {mission_id}.")
     return None, None
 
+# Function to get the mean location of all of a mission's photos, read in one pass over its media pages
+def get_mission_centroid(api_token, mission_id, use_cache=True):
+    print(f"Retrieving media centroid for mission ID {mission_id}...")
+    return media_footprint(iter_pages(api_token, f'/missions/{mission_id}/media', use_cache=use_cache)).centroid()
+
 # Function to check and add 'mission_count' field if it doesn't exist
 def add_mission_count_field_if_not_exists(feature_layer):
     fields = feature_layer.properties.fields
@@ -62,70 +48,119 @@ def add_mission_count_field_if_not_exists(feature_layer):
     else:
         print("'mission_count' field already exists in the feature layer.")
 
+# Function to build the feature for one mission; mission_count is its position in the project's mission list
+# location='centroid' places the feature at the mean of all the mission's photos instead of its first photo.
+# previous (the attributes of the mission's feature already in the layer) supplies the location instead of
+# a media lookup when the mission's name and end time are unchanged and it already has a location.
+# use_cache=False looks media up live, so a mission whose photos were still missing is checked again.
+def get_mission_feature(api_token, project_id, project_name, mission, mission_count, location='first', previous=None, use_cache=True):
+    end_time = mission_time_ms(mission)
+    if (previous and previous.get('latitude') is not None
+            and previous.get('mission_name') == mission['name'] and previous.get('end_time') == end_time):
+        latitude, longitude = previous['latitude'], previous['longitude']
+    elif location == 'centroid':
+        latitude, longitude = get_mission_centroid(api_token, mission['id'], use_cache=use_cache)
+    else:
+        latitude, longitude = get_first_media_location(api_token, mission['id'], use_cache=use_cache)
+    mission_url = f"https://sitescan.arcgis.com/projects/{project_id}/missions/{mission['id']}"
+    
+    return {
+        'attributes': {
+            'project_id': project_id,
+            'project_name': project_name,
+            'mission_id': mission['id'],
+            'mission_name': mission['name'],
+            'end_time': end_time,  # Milliseconds since epoch (UTC)
+            'latitude': latitude,
+            'longitude': longitude,
+            'mission_url': mission_url,
+            'mission_count': mission_count  # Set the mission count incrementally
+        },
+        'geometry': {
+            'x': longitude,
+            'y': latitude,
+            'spatialReference': {'wkid': 4326}
+        }
+    }
+
 # Function to get the most recent missions in a specific project
-def get_most_recent_missions_in_project(api_token, project_id, project_name, feature_layer):
+# max_workers > 1 fetches that many missions' media concurrently; feature order still follows the mission list
+# pipeline=True writes features in chunks while later missions are still being fetched (best with 'upsert')
+# incremental=True only looks up media for new or changed missions, reusing the locations already in the
+# layer for the rest, and upserts so only the features that differ are sent
+def get_most_recent_missions_in_project(api_token, project_id, project_name, feature_layer, max_workers=1, write_mode='replace', pipeline=False,
+                                        location='first', incremental=False):
     print(f"Processing most recent missions for project ID {project_id}...")
-    new_features = []
 
-    missions = get_all_missions(api_token, project_id)
+    missions = get_all_missions(api_token, project_id, use_cache=not incremental)
     
     # List and count all missions
     print(f"Total number of missions in project '{project_name}': {len(missions)}")
-    mission_count = 0
-    for mission in missions:
-        mission_count += 1
-        latitude, longitude = get_first_media_location(api_token, mission['id'])
-        mission_url = f"https://sitescan.arcgis.com/projects/{project_id}/missions/{mission['id']}"
-        
-        # Parse end time to ensure it's in UTC
-        end_time_utc = parse(mission.get('endTime', mission['created'])).astimezone(timezone.utc)
-        
-        feature = {
-            'attributes': {
-                'project_id': project_id,
-                'project_name': project_name,
-                'mission_id': mission['id'],
-                'mission_name': mission['name'],
-                'end_time': int(end_time_utc.timestamp() * 1000),  # Ensure the time is in milliseconds since epoch
-                'latitude': latitude,
-                'longitude': longitude,
-                'mission_url': mission_url,
-                'mission_count': mission_count  # Set the mission count incrementally
-            },
-            'geometry': {
-                'x': longitude,
-                'y': latitude,
-                'spatialReference': {'wkid': 4326}
-            }
-        }
-        new_features.append(feature)
+    existing = {}
+    if incremental:
+        write_mode = 'upsert'  # Unchanged missions must keep their existing features
+        _, existing, _ = query_existing_features(feature_layer, 'mission_id', where=f"project_id = '{project_id}'")
+    build_feature = lambda numbered: get_mission_feature(
+        api_token, project_id, project_name, numbered[1], numbered[0], location=location,
+        previous=existing[numbered[1]['id']]['attributes'] if numbered[1]['id'] in existing else None,
+        use_cache=not incremental
+    )
+    
+    if pipeline:
+        # Features go to the writer as they are built, in completion order
+        reports = write_features_streaming(
+            feature_layer,
+            fan_out_iter(build_feature, enumerate(missions, start=1), max_workers=max_workers),
+            'mission_id', where=f"project_id = '{project_id}'", write_mode=write_mode
+        )
+        written = sum(report['adds'] + report['updates'] for report in reports)
+        print(f"Wrote {written} features for project ID {project_id} using '{write_mode}' mode in pipeline mode.")
+        return
+    
+    new_features = run_in_pool(build_feature, enumerate(missions, start=1), max_workers=max_workers)
             
     if new_features:
-        # Delete existing features for this project
-        feature_layer.delete_features(where=f"project_id = '{project_id}'")
-        print(f"Deleted existing features for project ID {project_id}.")
-        
-        # Add new features
-        feature_layer.edit_features(adds=new_features)
-        print(f"Added {len(new_features)} new features.")
+        # Replace or reconcile the existing features for this project, keyed by mission ID
+        write_features(feature_layer, new_features, 'mission_id', where=f"project_id = '{project_id}'", write_mode=write_mode)
+        print(f"Wrote {len(new_features)} features for project ID {project_id} using '{write_mode}' mode.")
 
-# Example usage
-api_token = ''  # Replace with your actual API token
-project_id = ''  # Replace with your specific project ID
-project_name = ''  # Replace with your specific project name
-item_id = ""  # Replace with your actual feature layer item ID
+# Function to write one feature per mission of a project from an org-wide mission catalog.
+# The catalog (missionCatalog.py, needs NumPy) is loaded from catalog_path when that file exists and is no older
+# than catalog_max_age seconds (default missionCatalog.layer_catalog_max_age),
+# otherwise the whole organization is fetched in one bulk pass and can be reused for its other projects.
+def get_missions_in_project_from_catalog(api_token, org_id, project_id, feature_layer, catalog_path=None, max_workers=1, write_mode='replace',
+                                         catalog_max_age=None):
+    from missionCatalog import layer_catalog_max_age, load_or_build_catalog
+    catalog = load_or_build_catalog(api_token, org_id, catalog_path, max_workers=max_workers,
+                                    max_age=layer_catalog_max_age if catalog_max_age is None else catalog_max_age)
+    new_features = catalog.project_features(api_token, project_id, max_workers=max_workers)
+    if new_features:
+        write_features(feature_layer, new_features, 'mission_id', where=f"project_id = '{project_id}'", write_mode=write_mode)
+        print(f"Wrote {len(new_features)} features for project ID {project_id} from the mission catalog using '{write_mode}' mode.")
+    if catalog_path:
+        catalog.save(catalog_path)  # Keep the looked-up locations for the next run
 
-# Debug information
-print(f"Using item ID: {item_id}")
+# Example usage
+if __name__ == "__main__":
+    api_token = ''  # Leave empty to use the cached, auto-refreshing token from tokenManager
+    project_id = ''  # Replace with your specific project ID
+    project_name = ''  # Replace with your specific project name
+    item_id = ""  # Replace with your actual feature layer item ID
+    write_mode = "upsert"  # "upsert" sends only changed features, "replace" deletes and re-adds everything, "bulk" replaces via one uploaded file
+    max_workers = 8  # Number of missions fetched concurrently (1 = sequential)
+    pipeline = False  # True to write features while later missions are still being fetched
+    location = 'first'  # 'first' photo or 'centroid' of all photos for each mission's point
+    org_id = ''  # Only needed with catalog_path: the organization the project belongs to
+    catalog_path = ''  # Set to a .npz file to work from an org-wide mission catalog, refetched once it is an hour old
+    dry_run = False  # True to fetch from SiteScan but skip the ArcGIS login and write nothing
 
-feature_layer_item = gis.content.get(item_id)
-if feature_layer_item is None:
-    print(f"Feature layer item with ID {item_id} not found.")
-else:
-    print(f"Feature layer item found: {feature_layer_item.title}")
-    if not feature_layer_item.layers:
-        print(f"No layers found in item with ID {item_id}.")
-    else:
-        feature_layer = feature_layer_item.layers[0]
+    try:
+        feature_layer = open_feature_layer(item_id, dry_run=dry_run)  # Logs in on first use
         add_mission_count_field_if_not_exists(feature_layer)
-        get_most_recent_missions_in_project(api_token, project_id, project_name, feature_layer)
\ No newline at end of file
+        if catalog_path:
+            get_missions_in_project_from_catalog(api_token, org_id, project_id, feature_layer, catalog_path=catalog_path, max_workers=max_workers, write_mode=write_mode)
+        else:
+            get_most_recent_missions_in_project(api_token, project_id, project_name, feature_layer, max_workers=max_workers, write_mode=write_mode, pipeline=pipeline, location=location)
+    finally:
+        # Write the metrics report when SITESCAN_METRICS_FILE is set
+        write_reports()
@@ -1,31 +1,28 @@
-#This creates a site scan API token
+#This creates a site scan API token and caches it for the other scripts
 
 import requests
+import tokenManager
  
-SITESCAN_API = "https://sitescan-api.arcgis.com/api/v2"
- 
-# Replace with your actual email and password
+# Replace with your actual email and password (or set SITESCAN_EMAIL and SITESCAN_PASSWORD)
 
 email = ""
 
 password = ""
  
-# Obtain an API token
-
-response = requests.post(f"{SITESCAN_API}/auth/session/api", auth=(email, password))
- 
-# Check if the request was successful (status code 200)
+# Obtain an API token and save it where the other scripts look for it
 
-if response.status_code == 200:
+if email and password:
 
-    # Parse the JSON response to get the token
+    tokenManager.set_credentials(email, password)
 
-    response_json = response.json()
+try:
 
-    token = response_json.get('token')
+    token = tokenManager.refresh_token(force=True)
 
     print(f"API Token: {token}")
 
-else:
+    print(f"Token cached in {tokenManager.token_path}; the other scripts use it when api_token is left empty.")
+
+except requests.HTTPError as error:
 
-    print(f"Failed to obtain API token. Status Code: {response.status_code}")
\ No newline at end of file
+    print(f"Failed to obtain API token. Status Code: {error.response.status_code}")
@@ -1,133 +1,140 @@
 # This gets the photo URLs from a mission
 
-import requests
-from datetime import datetime, timezone
-from dateutil.parser import parse
-from arcgis.gis import GIS
-from arcgis.features import FeatureLayerCollection
-import getpass  # To securely get password input
-
-# Initialize GIS with username and password
-print("Please enter your ArcGIS Online credentials:")
-username = input("Username: ")
-password = getpass.getpass("Password: ")
-gis = GIS("https://www.arcgis.com", username, password)
-print("Connected to ArcGIS Online using user credentials.")
+from sitescanClient import sitescan_get, iter_pages, get_project_name, get_mission_name
+from layerWriter import write_features, write_features_streaming
+from pipeline import background_iter
+from spatialIndex import thin, media_footprint
+from gisLogin import open_feature_layer
+from metrics import write_reports
 
 # Function to retrieve all projects
 def get_all_projects(api_token, org_id):
     print("Retrieving all projects from SiteScan...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    projects_url = f'https://sitescan-api.arcgis.com/api/v2/organizations/{org_id}/projects'
-    response = requests.get(projects_url, headers=headers)
-    response.raise_for_status()
-    projects = response.json()
+    projects = sitescan_get(api_token, f'/organizations/{org_id}/projects')
     print(f"Retrieved {len(projects)} projects.")
     return projects
 
 # Function to retrieve all missions for a given project
 def get_all_missions(api_token, project_id):
     print(f"Retrieving all missions for project ID {project_id}...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    missions_url = f'https://sitescan-api.arcgis.com/api/v2/projects/{project_id}/missions'
-    response = requests.get(missions_url, headers=headers)
-    response.raise_for_status()
-    missions = response.json()
+    missions = sitescan_get(api_token, f'/projects/{project_id}/missions')
     return missions
 
-# Function to get all media locations and URLs for a mission
-def get_all_media_locations_and_urls(api_token, mission_id):
+# Function to yield the location and URL of each photo in a mission, one page of media at a time
+def iter_media_locations_and_urls(api_token, mission_id):
     print(f"Retrieving all media locations and URLs for mission ID {mission_id}...")
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Content-Type': 'application/json'
-    }
-    media_url = f'https://sitescan-api.arcgis.com/api/v2/missions/{mission_id}/media'
-    response = requests.get(media_url, headers=headers)
-    response.raise_for_status()
-    media = response.json()
-    media_list = []
-    if media:
-        for media_item in media:
-            location = media_item.get('location', {})
-            coordinates = location.get('coordinates', [])
-            photo_url = media_item.get('url', '')
-            if coordinates and photo_url:
-                media_list.append({
-                    'latitude': coordinates[1],
-                    'longitude': coordinates[0],
-                    'photo_url': photo_url
-                })
-        print(f"Retrieved {len(media_list)} media locations and URLs for mission ID {mission_id}.")
+    media_count = 0
+    for media_item in iter_pages(api_token, f'/missions/{mission_id}/media'):
+        location = media_item.get('location', {})
+        coordinates = location.get('coordinates', [])
+        photo_url = media_item.get('url', '')
+        if coordinates and photo_url:
+            media_count += 1
+            yield {
+                'latitude': coordinates[1],
+                'longitude': coordinates[0],
+                'photo_url': photo_url
+            }
+    if media_count:
+        print(f"Retrieved {media_count} media locations and URLs for mission ID {mission_id}.")
     else:
         print(f"No media available for mission ID {mission_id}.")
-    return media_list
 
-# Function to get all media from a specific mission and update the feature layer
-def update_feature_layer_with_mission_media(api_token, project_id, mission_id, feature_layer):
-    media_list = get_all_media_locations_and_urls(api_token, mission_id)
-    new_features = []
+# Function to get all media locations and URLs for a mission
+def get_all_media_locations_and_urls(api_token, mission_id):
+    return list(iter_media_locations_and_urls(api_token, mission_id))
+
+# Function to get all media from a specific mission and update the feature layer.
+# Photos are fetched page by page and written chunk by chunk, so memory stays bounded per page.
+# pipeline=True fetches the next media pages on a background thread while earlier chunks are written
+# thin_cell_size (metres) keeps only the first photo in each grid cell of that size
+def update_feature_layer_with_mission_media(api_token, project_id, mission_id, feature_layer, write_mode='replace', pipeline=False,
+                                            thin_cell_size=None):
+    # Retrieve project name and mission name (cached id -> name lookups)
+    project_name = get_project_name(api_token, project_id)
+    mission_name = get_mission_name(api_token, mission_id)
     
-    # Retrieve project name and mission name
-    projects = get_all_projects(api_token, org_id)
-    project_name = next((project['name'] for project in projects if project['id'] == project_id), None)
-    missions = get_all_missions(api_token, project_id)
-    mission_name = next((mission['name'] for mission in missions if mission['id'] == mission_id), None)
+    # Function to turn each photo into a feature as the writer asks for it
+    def iter_features():
+        media = iter_media_locations_and_urls(api_token, mission_id)
+        if thin_cell_size:
+            media = thin(media, thin_cell_size, lambda media_item: (media_item['latitude'], media_item['longitude']))
+        # Incremental photo count
+        photo_count = 0
+        for media_item in media:
+            photo_count += 1
+            yield {
+                'attributes': {
+                    'project_id': project_id,
+                    'project_name': project_name,
+                    'mission_id': mission_id,
+                    'mission_name': mission_name,
+                    'photo_url': media_item['photo_url'],
+                    'photo_count': photo_count  # Incremental photo count
+                },
+                'geometry': {
+                    'x': media_item['longitude'],
+                    'y': media_item['latitude'],
+                    'spatialReference': {'wkid': 4326}
+                }
+            }
     
-    # Incremental photo count
-    photo_count = 0
+    features = background_iter(iter_features()) if pipeline else iter_features()
     
-    for media_item in media_list:
-        photo_count += 1
-        feature = {
-            'attributes': {
-                'project_id': project_id,
-                'project_name': project_name,
-                'mission_id': mission_id,
-                'mission_name': mission_name,
-                'photo_url': media_item['photo_url'],
-                'photo_count': photo_count  # Incremental photo count
-            },
-            'geometry': {
-                'x': media_item['longitude'],
-                'y': media_item['latitude'],
-                'spatialReference': {'wkid': 4326}
-            }
-        }
-        new_features.append(feature)
+    # Replace or reconcile the existing features, keyed by photo URL
+    reports = write_features_streaming(feature_layer, features, 'photo_url', write_mode=write_mode)
+    written = sum(report['adds'] + report['updates'] for report in reports)
+    print(f"Wrote {written} features with media URLs and photo count using '{write_mode}' mode.")
+
+# Function to write one feature per mission outlining where its photos were taken, instead of one per photo.
+# shape is 'hull' (convex hull polygon), 'bbox' (bounding box polygon) or 'centroid' (point) and must match the
+# layer's geometry type. All the mission's media is read in one pass; only this mission's feature is replaced.
+def update_feature_layer_with_mission_footprint(api_token, project_id, mission_id, feature_layer, shape='hull', write_mode='replace'):
+    project_name = get_project_name(api_token, project_id)
+    mission_name = get_mission_name(api_token, mission_id)
     
-    if new_features:
-        # Delete existing features
-        feature_layer.delete_features(where="1=1")
-        print("Deleted existing features.")
-        
-        # Add new features
-        feature_layer.edit_features(adds=new_features)
-        print(f"Added {len(new_features)} new features with media URLs and photo count.")
+    print(f"Building the '{shape}' footprint of mission ID {mission_id} from its media...")
+    footprint = media_footprint(iter_pages(api_token, f'/missions/{mission_id}/media'))
+    geometry = footprint.geometry(shape)
+    if geometry is None:
+        print(f"No media locations for mission ID {mission_id}; nothing written.")
+        return
+    latitude, longitude = footprint.centroid()
+    feature = {
+        'attributes': {
+            'project_id': project_id,
+            'project_name': project_name,
+            'mission_id': mission_id,
+            'mission_name': mission_name,
+            'photo_count': footprint.count,  # Photos the footprint was built from
+            'latitude': latitude,
+            'longitude': longitude
+        },
+        'geometry': geometry
+    }
+    write_features(feature_layer, [feature], 'mission_id', where=f"mission_id = '{mission_id}'", write_mode=write_mode)
+    print(f"Wrote the footprint of {footprint.count} photos for mission ID {mission_id} using '{write_mode}' mode.")
 
 # Example usage
-api_token = ''  # Replace with your actual API token
-org_id = ''  # Replace with your actual organization ID
-project_id = ''  # Replace with your actual project ID
-mission_id = ''  # Replace with your actual mission ID
-item_id = ""  # Replace with your actual feature layer item ID
+if __name__ == "__main__":
+    api_token = ''  # Leave empty to use the cached, auto-refreshing token from tokenManager
+    org_id = ''  # Replace with your actual organization ID
+    project_id = ''  # Replace with your actual project ID
+    mission_id = ''  # Replace with your actual mission ID
+    item_id = ""  # Replace with your actual feature layer item ID
+    write_mode = "upsert"  # "upsert" sends only changed features, "replace" deletes and re-adds everything, "bulk" replaces via one uploaded file
+    pipeline = False  # True to fetch the next media pages while earlier features are written
+    thin_cell_size = None  # Metres; set to keep only one photo per grid cell of this size
+    footprint = None  # 'hull', 'bbox' or 'centroid' to write one footprint feature for the mission instead of its photos
+    dry_run = False  # True to fetch from SiteScan but skip the ArcGIS login and write nothing
 
-# Debug information
-print(f"Using item ID: {item_id}")
-
-feature_layer_item = gis.content.get(item_id)
-if feature_layer_item is None:
-    print(f"Feature layer item with ID {item_id} not found.")
-else:
-    print(f"Feature layer item found: {feature_layer_item.title}")
-    if not feature_layer_item.layers:
-        print(f"No layers found in item with ID {item_id}.")
-    else:
-        feature_layer = feature_layer_item.layers[0]
-        update_feature_layer_with_mission_media(api_token, project_id, mission_id, feature_layer)
+    try:
+        feature_layer = open_feature_layer(item_id, dry_run=dry_run)  # Logs in on first use
+        if footprint:
+            update_feature_layer_with_mission_footprint(api_token, project_id, mission_id, feature_layer, shape=footprint, write_mode=write_mode)
+        else:
+            update_feature_layer_with_mission_media(api_token, project_id, mission_id, feature_layer, write_mode=write_mode, pipeline=pipeline,
+                                                    thin_cell_size=thin_cell_size)
+    finally:
+        # Write the metrics report when SITESCAN_METRICS_FILE is set
+        write_reports()
@@ -0,0 +1,202 @@
+# ArcGIS Online login and feature layer lookup shared by the scripts
+#
+# arcgis is only imported, and the login only made, when a layer is first used: open_feature_layer
+# returns a lazy layer, so scripts start instantly and dry runs never log in at all.
+# Credentials come from the arguments, ARCGIS_USERNAME/ARCGIS_PASSWORD, an arcgis profile
+# (ARCGIS_PROFILE) or a prompt, and the session token is cached so later runs skip the login.
+# When a layer call is rejected because the token has expired, the layer logs in again with
+# the credentials (never the cached token) and retries the call once, so long-lived processes keep working.
+
+import getpass  # To securely get password input
+import json
+import os
+import threading
+import time
+
+from metrics import InstrumentedLayer
+
+ARCGIS_URL = "https://www.arcgis.com"
+
+token_path = os.environ.get(
+    "ARCGIS_TOKEN_PATH",
+    os.path.join(os.path.expanduser("~"), ".sitescan", "arcgis_token.json")
+)
+token_ttl = 50 * 60  # Seconds a cached token is reused; ArcGIS tokens from a login last an hour
+
+# Phrases in ArcGIS errors for a rejected or expired token (error codes 498 and 499)
+TOKEN_ERRORS = ('invalid token', 'token required', 'token expired', 'error code: 498', 'error code: 499')
+
+_lock = threading.Lock()
+_gis = None
+
+# Function to check whether an ArcGIS error means the session token is no longer accepted
+def is_token_error(error):
+    message = str(error).lower()
+    return any(phrase in message for phrase in TOKEN_ERRORS)
+
+# Function to read a cached token for this login, or None if there is none or it has expired
+def _read_token_file(login_name):
+    try:
+        with open(token_path) as token_file:
+            saved = json.load(token_file)
+    except (OSError, ValueError):
+        return None
+    if saved.get('login') != login_name or saved.get('expires', 0) <= time.time():
+        return None
+    return saved.get('token')
+
+# Function to cache the session's token on disk, readable only by the current user
+def _write_token_file(login_name, gis):
+    try:
+        token = gis._con.token
+    except AttributeError:
+        return
+    if not token:
+        return
+    os.makedirs(os.path.dirname(token_path), exist_ok=True)
+    temp_path = f"{token_path}.{os.getpid()}.tmp"
+    descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as token_file:
+        json.dump({'login': login_name, 'token': token, 'expires': time.time() + token_ttl}, token_file)
+    os.replace(temp_path, token_path)
+
+# Function to connect with a cached token, or None if it is missing or no longer accepted
+def _connect_with_cached_token(login_name):
+    from arcgis.gis import GIS
+    token = _read_token_file(login_name)
+    if token is None:
+        return None
+    try:
+        gis = GIS(ARCGIS_URL, token=token)
+        if gis.users.me is not None:
+            print("Connected to ArcGIS Online using the cached session token.")
+            return gis
+    except Exception:
+        pass
+    return None
+
+# Function to connect to ArcGIS Online. Credentials come from the arguments, then
+# ARCGIS_USERNAME/ARCGIS_PASSWORD, then the ARCGIS_PROFILE profile, and are only
+# prompted for when interactive is True. A cached session token is tried first unless use_cached_token is False.
+def connect_gis(username=None, password=None, interactive=True, use_cached_token=True):
+    from arcgis.gis import GIS
+    username = username or os.environ.get("ARCGIS_USERNAME")
+    password = password or os.environ.get("ARCGIS_PASSWORD")
+    profile = os.environ.get("ARCGIS_PROFILE")
+    login_name = username or (f"profile:{profile}" if profile else None)
+
+    if login_name and use_cached_token:
+        gis = _connect_with_cached_token(login_name)
+        if gis is not None:
+            return gis
+
+    if profile and not (username and password):
+        gis = GIS(profile=profile)
+        print(f"Connected to ArcGIS Online using profile '{profile}'.")
+    else:
+        if not (username and password):
+            if not interactive:
+                raise RuntimeError("No ArcGIS credentials: set ARCGIS_USERNAME and ARCGIS_PASSWORD or ARCGIS_PROFILE.")
+            print("Please enter your ArcGIS Online credentials:")
+            username = username or input("Username: ")
+            password = password or getpass.getpass("Password: ")
+            login_name = username
+        gis = GIS(ARCGIS_URL, username, password)
+        print("Connected to ArcGIS Online using user credentials.")
+    _write_token_file(login_name, gis)
+    return gis
+
+# Function to get this process's GIS connection, logging in on first use
+def get_gis(interactive=True):
+    global _gis
+    with _lock:
+        if _gis is None:
+            _gis = connect_gis(interactive=interactive)
+        return _gis
+
+# Function to replace a connection whose token was rejected with a fresh login.
+# Only the first caller holding the stale connection logs in; the others get its new one.
+def refresh_gis(stale_gis, interactive=True):
+    global _gis
+    with _lock:
+        if _gis is None or _gis is stale_gis:
+            print("ArcGIS session token was rejected, logging in again...")
+            _gis = connect_gis(interactive=interactive, use_cached_token=False)
+        return _gis
+
+# Function to get the first layer of a feature layer item, or None if it cannot be found.
+# The layer is wrapped so its calls show up in the metrics report.
+def get_feature_layer(gis, item_id):
+    # Debug information
+    print(f"Using item ID: {item_id}")
+
+    feature_layer_item = gis.content.get(item_id)
+    if feature_layer_item is None:
+        print(f"Feature layer item with ID {item_id} not found.")
+        return None
+    print(f"Feature layer item found: {feature_layer_item.title}")
+    if not feature_layer_item.layers:
+        print(f"No layers found in item with ID {item_id}.")
+        return None
+    return InstrumentedLayer(feature_layer_item.layers[0])
+
+
+# Feature layer stand-in that logs in and looks the layer up the first time any attribute is used.
+# A method call rejected for an expired token logs in again, looks the layer up again and is retried once.
+class LazyFeatureLayer:
+    def __init__(self, item_id, interactive=True):
+        self._item_id = item_id
+        self._interactive = interactive
+        self._layer = None
+        self._layer_gis = None
+        self._resolve_lock = threading.Lock()
+
+    # Function to look the layer up on a connection
+    def _open(self, gis):
+        layer = get_feature_layer(gis, self._item_id)
+        if layer is None:
+            raise RuntimeError(f"Feature layer item {self._item_id} not found or has no layers.")
+        self._layer = layer
+        self._layer_gis = gis
+        return layer
+
+    # Function to log in and find the layer, once
+    def _resolve(self):
+        with self._resolve_lock:
+            if self._layer is None:
+                return self._open(get_gis(self._interactive))
+            return self._layer
+
+    # Function to log in again and find the layer on the new connection, unless another thread already has
+    def _reconnect(self, stale_layer):
+        with self._resolve_lock:
+            if self._layer is stale_layer:
+                return self._open(refresh_gis(self._layer_gis, self._interactive))
+            return self._layer
+
+    def __getattr__(self, name):
+        attribute = getattr(self._resolve(), name)
+        if not callable(attribute):
+            return attribute
+
+        # Function to call the layer method, logging in again once if the token was rejected
+        def call(*args, **kwargs):
+            layer = self._resolve()
+            try:
+                return getattr(layer, name)(*args, **kwargs)
+            except Exception as error:
+                if not is_token_error(error):
+                    raise
+                return getattr(self._reconnect(layer), name)(*args, **kwargs)
+        return call
+
+
+# Function to get the feature layer for an item without logging in until it is first used.
+# With dry_run=True nothing is sent to ArcGIS Online: the jobs write into an empty in-memory
+# layer instead, so the SiteScan side runs for real and the write counts are still printed.
+def open_feature_layer(item_id, dry_run=False, interactive=True):
+    if dry_run:
+        from mockSiteScan import FakeFeatureLayer
+        print(f"Dry run: nothing will be written to item {item_id}.")
+        return InstrumentedLayer(FakeFeatureLayer())
+    return LazyFeatureLayer(item_id, interactive=interactive)
@@ -0,0 +1,319 @@
+# Helpers for writing features to an ArcGIS feature layer
+
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from concurrentFetch import run_in_pool
+from pipeline import TICK, background_iter
+
+WRITE_MODES = ('replace', 'upsert', 'bulk')
+
+# Chunked writer settings
+default_chunk_size = 1000  # Maximum number of edits sent in one edit_features call
+default_max_writers = 4  # Number of chunks submitted in parallel
+max_retries = 3  # Retries per chunk after the first attempt
+retry_delay = 2  # Base delay in seconds, doubled on every retry
+# Errors raised before a request reaches the server; any other failure may have been applied
+UNSENT_ERRORS = ('ConnectTimeout', 'NewConnectionError', 'ConnectionRefusedError')
+stream_flush_seconds = 1.0  # The streaming writer sends a partial chunk once it has waited this long
+
+# Function to split a list into chunks of at most size items
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# Function to split any iterable into lists of at most size items without materializing it.
+# With max_seconds set, a chunk is also yielded early once its first item is that many seconds old,
+# so a slow producer's items are not held back until a whole chunk has built up. The age is checked
+# on every item and on every pipeline.TICK, which background_iter(tick=...) yields while it waits.
+def iter_chunks(items, size, max_seconds=None):
+    chunk = []
+    started = None
+    for item in items:
+        if item is TICK:
+            if chunk and max_seconds is not None and time.monotonic() - started >= max_seconds:
+                yield chunk
+                chunk = []
+            continue
+        if not chunk:
+            started = time.monotonic()
+        chunk.append(item)
+        if len(chunk) == size or (max_seconds is not None and time.monotonic() - started >= max_seconds):
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Function to compare two values, allowing for float round-off from the feature service
+def _same_value(old, new):
+    if isinstance(old, float) or isinstance(new, float):
+        if old is None or new is None:
+            return old is new
+        return round(float(old), 7) == round(float(new), 7)
+    return old == new
+
+# Function to compare two polygons' rings vertex by vertex
+def _same_rings(old, new):
+    if not old or not new or len(old) != len(new):
+        return old == new
+    for old_ring, new_ring in zip(old, new):
+        if len(old_ring) != len(new_ring):
+            return False
+        for old_point, new_point in zip(old_ring, new_ring):
+            if not (_same_value(old_point[0], new_point[0]) and _same_value(old_point[1], new_point[1])):
+                return False
+    return True
+
+# Function to check whether an existing feature already matches the new one
+def _feature_changed(existing, new_feature):
+    existing_attributes = existing['attributes']
+    for name, value in new_feature['attributes'].items():
+        if not _same_value(existing_attributes.get(name), value):
+            return True
+    new_geometry = new_feature.get('geometry') or {}
+    existing_geometry = existing.get('geometry') or {}
+    if 'rings' in new_geometry or 'rings' in existing_geometry:
+        return not _same_rings(existing_geometry.get('rings'), new_geometry.get('rings'))
+    return not (_same_value(existing_geometry.get('x'), new_geometry.get('x'))
+                and _same_value(existing_geometry.get('y'), new_geometry.get('y')))
+
+# Function to query existing features in the layer, grouped by key
+def query_existing_features(feature_layer, key_field, where="1=1"):
+    object_id_field = feature_layer.properties.objectIdField
+    feature_set = feature_layer.query(where=where, out_fields="*", return_geometry=True, out_sr=4326)
+    existing = {}
+    duplicates = []
+    for feature in feature_set.features:
+        record = {'attributes': feature.attributes, 'geometry': feature.geometry}
+        key = feature.attributes.get(key_field)
+        if key in existing:
+            duplicates.append(feature.attributes[object_id_field])
+        else:
+            existing[key] = record
+    return object_id_field, existing, duplicates
+
+# Function to work out the adds and updates for a batch of new features, adding their keys to seen
+def _diff_batch(existing, object_id_field, key_field, new_features, seen):
+    adds = []
+    updates = []
+    for feature in new_features:
+        key = feature['attributes'].get(key_field)
+        seen.add(key)
+        current = existing.get(key)
+        if key is None or current is None:
+            adds.append(feature)
+        elif _feature_changed(current, feature):
+            update = {'attributes': dict(feature['attributes']), 'geometry': feature.get('geometry')}
+            update['attributes'][object_id_field] = current['attributes'][object_id_field]
+            updates.append(update)
+    return adds, updates
+
+# Function to work out the adds, updates and deletes needed to make the layer match new_features
+# Existing features whose key is in keep_keys are left alone even when missing from new_features.
+def diff_features(feature_layer, new_features, key_field, where="1=1", delete_missing=True, keep_keys=()):
+    object_id_field, existing, deletes = query_existing_features(feature_layer, key_field, where)
+    seen = set()
+    adds, updates = _diff_batch(existing, object_id_field, key_field, new_features, seen)
+    if delete_missing:
+        seen.update(keep_keys)
+        deletes.extend(
+            record['attributes'][object_id_field]
+            for key, record in existing.items() if key not in seen
+        )
+    return adds, updates, deletes
+
+# Function to count the failed entries in an edit_features result
+def _count_failures(result):
+    failures = 0
+    for key in ('addResults', 'updateResults', 'deleteResults'):
+        failures += sum(1 for item in (result or {}).get(key, []) if not item.get('success', False))
+    return failures
+
+# Function to check whether a failed call never reached the server, so resending it cannot add anything twice
+def _never_sent(error):
+    return type(error).__name__ in UNSENT_ERRORS or 'Failed to establish a new connection' in str(error)
+
+# Function to get the adds whose key_field value is not in the layer yet, or None when that cannot
+# be checked (no key field, or adds without a key)
+def _adds_not_in_layer(feature_layer, key_field, adds):
+    keys = [feature['attributes'].get(key_field) for feature in adds] if key_field else [None]
+    if None in keys:
+        return None
+    found = set()
+    for batch in chunked(keys, 200):
+        values = ",".join("'" + str(key).replace("'", "''") + "'" for key in batch)
+        feature_set = feature_layer.query(where=f"{key_field} IN ({values})", out_fields=key_field, return_geometry=False)
+        found.update(str(feature.attributes.get(key_field)) for feature in feature_set.features)
+    return [feature for feature in adds if str(feature['attributes'][key_field]) not in found]
+
+# Function to submit one chunk of edits, retrying it on its own if the call fails.
+# A call that failed after reaching the server (e.g. a read timeout) may still have been applied,
+# so before it is retried the layer is checked and only the adds whose key_field value is missing
+# are sent again; without a key_field to check by, such adds are not resent and the chunk fails.
+# on_written, if given, is called with the chunk's added and updated features once it succeeds.
+def _submit_chunk(feature_layer, number, adds, updates, deletes, retries, on_written=None, key_field=None):
+    report = {'chunk': number, 'adds': len(adds), 'updates': len(updates), 'deletes': len(deletes),
+              'attempts': 0, 'failed': 0, 'success': False, 'error': None}
+    written = adds + updates
+    check_adds = False  # Set once a failed call may have been applied
+    for attempt in range(retries + 1):
+        report['attempts'] = attempt + 1
+        try:
+            if check_adds:
+                remaining = _adds_not_in_layer(feature_layer, key_field, adds)
+                if remaining is None:
+                    report['failed'] = len(adds)
+                    report['error'] = f"{report['error']} (adds not resent: they may already have been applied)"
+                    break
+                if len(remaining) < len(adds):
+                    print(f"Chunk {number}: {len(adds) - len(remaining)} adds were applied before the failure; not resending them.")
+                adds = remaining
+                check_adds = False
+            result = {}
+            if adds or updates or deletes:
+                result = feature_layer.edit_features(
+                    adds=adds or None,
+                    updates=updates or None,
+                    deletes=",".join(str(object_id) for object_id in deletes) or None
+                )
+        except Exception as error:
+            report['error'] = repr(error)
+            check_adds = check_adds or (bool(adds) and not _never_sent(error))
+            if attempt < retries:
+                delay = retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"Chunk {number} failed ({error!r}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+            continue
+        report['failed'] = _count_failures(result)
+        report['success'] = report['failed'] == 0
+        report['error'] = None
+        break
+    status = "ok" if report['success'] else f"FAILED ({report['failed']} rejected, error={report['error']})"
+    print(f"Chunk {number}: {report['adds']} adds, {report['updates']} updates, {report['deletes']} deletes - {status}")
+    if report['success'] and on_written is not None:
+        on_written(written)
+    return report
+
+# Function to send adds, updates and deletes in chunks with a few parallel submitters.
+# Returns one report per chunk so callers can see exactly which part of a write failed.
+# key_field lets a chunk that failed after reaching the server be retried without adding features twice.
+def submit_edits(feature_layer, adds=(), updates=(), deletes=(), chunk_size=None, max_writers=None, retries=None, on_written=None,
+                 key_field=None):
+    size = chunk_size or default_chunk_size
+    writers = max_writers or default_max_writers
+    retries = max_retries if retries is None else retries
+    edits = [('adds', item) for item in adds] + [('updates', item) for item in updates] + [('deletes', item) for item in deletes]
+    chunks = []
+    for number, batch in enumerate(chunked(edits, size), start=1):
+        chunks.append((
+            number,
+            [item for kind, item in batch if kind == 'adds'],
+            [item for kind, item in batch if kind == 'updates'],
+            [item for kind, item in batch if kind == 'deletes']
+        ))
+    return run_in_pool(
+        lambda chunk: _submit_chunk(feature_layer, *chunk, retries, on_written, key_field),
+        chunks,
+        max_workers=writers
+    )
+
+# Function to delete the features matching where and add new_features in their place
+def replace_features(feature_layer, new_features, where="1=1", chunk_size=None, max_writers=None, on_written=None, key_field=None):
+    feature_layer.delete_features(where=where)
+    return submit_edits(feature_layer, adds=new_features, chunk_size=chunk_size, max_writers=max_writers, on_written=on_written,
+                        key_field=key_field)
+
+# Function to reconcile the layer against new_features by key_field, sending only what changed
+def upsert_features(feature_layer, new_features, key_field, where="1=1", delete_missing=True, keep_keys=(), chunk_size=None, max_writers=None,
+                    on_written=None):
+    adds, updates, deletes = diff_features(feature_layer, new_features, key_field, where, delete_missing, keep_keys)
+    print(f"Reconciling on '{key_field}': {len(adds)} adds, {len(updates)} updates, {len(deletes)} deletes.")
+    return submit_edits(feature_layer, adds, updates, deletes, chunk_size=chunk_size, max_writers=max_writers, on_written=on_written,
+                        key_field=key_field)
+
+# Function to write features using the chosen write mode ('replace', 'upsert' or 'bulk').
+# 'bulk' replaces like 'replace' but uploads everything as one file for a single append (see bulkUpload.py).
+# Returns the per-chunk reports from submit_edits.
+def write_features(feature_layer, new_features, key_field, where="1=1", write_mode="replace", keep_keys=(), chunk_size=None, max_writers=None,
+                   on_written=None):
+    if write_mode == 'bulk':
+        from bulkUpload import bulk_replace, supports_bulk
+        if not supports_bulk(feature_layer):
+            print("Layer does not support appending GeoJSON; falling back to 'replace' mode.")
+            write_mode = 'replace'
+    if write_mode == 'bulk':
+        reports = bulk_replace(feature_layer, new_features, key_field, where, on_written)
+    elif write_mode == 'replace':
+        reports = replace_features(feature_layer, new_features, where, chunk_size, max_writers, on_written, key_field)
+    elif write_mode == 'upsert':
+        reports = upsert_features(feature_layer, new_features, key_field, where, keep_keys=keep_keys,
+                                  chunk_size=chunk_size, max_writers=max_writers, on_written=on_written)
+    else:
+        raise ValueError(f"Unknown write mode '{write_mode}', expected one of {WRITE_MODES}.")
+    _warn_failed_chunks(reports)
+    return reports
+
+# Function to print a warning listing any chunks that failed
+def _warn_failed_chunks(reports):
+    failed_chunks = [report['chunk'] for report in reports if not report['success']]
+    if failed_chunks:
+        print(f"Warning: {len(failed_chunks)} of {len(reports)} chunks failed: {failed_chunks}")
+
+# Function to write features from an iterator chunk by chunk, so only about max_writers
+# chunks are held in memory however many features there are. write_mode works as in
+# write_features; nothing is deleted or written if the iterator yields no features.
+# A chunk is sent when it is full or flush_seconds after its first feature arrived, even while
+# the iterator is still waiting on a slow fetch, so writes overlap the fetching even when there
+# are fewer features than one chunk. The iterator is read on a background thread for this.
+def write_features_streaming(feature_layer, features, key_field, where="1=1", write_mode="replace", keep_keys=(),
+                             chunk_size=None, max_writers=None, on_written=None, flush_seconds=None):
+    if write_mode not in WRITE_MODES:
+        raise ValueError(f"Unknown write mode '{write_mode}', expected one of {WRITE_MODES}.")
+    if write_mode == 'bulk':
+        # The bulk path streams the features into its upload file, so memory stays flat there too
+        return write_features(feature_layer, features, key_field, where, write_mode, keep_keys, chunk_size, max_writers, on_written)
+    size = chunk_size or default_chunk_size
+    writers = max_writers or default_max_writers
+    reports = []
+    pending = deque()
+    seen = set()
+    existing = None
+    number = 0
+    executor = ThreadPoolExecutor(max_workers=writers)
+
+    # Function to queue a chunk, first waiting for the oldest one if all writers are busy
+    def submit(adds, updates, deletes):
+        nonlocal number
+        number += 1
+        if len(pending) >= writers:
+            reports.append(pending.popleft().result())
+        pending.append(executor.submit(_submit_chunk, feature_layer, number, adds, updates, deletes, max_retries, on_written,
+                                       key_field))
+
+    try:
+        flush = flush_seconds or stream_flush_seconds
+        for chunk in iter_chunks(background_iter(features, size=size, tick=flush / 4), size, flush):
+            if write_mode == 'replace':
+                if number == 0:
+                    feature_layer.delete_features(where=where)
+                submit(chunk, [], [])
+                continue
+            if existing is None:
+                object_id_field, existing, duplicates = query_existing_features(feature_layer, key_field, where)
+            adds, updates = _diff_batch(existing, object_id_field, key_field, chunk, seen)
+            if adds or updates:
+                submit(adds, updates, [])
+        if existing is not None:
+            seen.update(keep_keys)
+            deletes = duplicates + [record['attributes'][object_id_field]
+                                    for key, record in existing.items() if key not in seen]
+            for batch in chunked(deletes, size):
+                submit([], [], batch)
+        while pending:
+            reports.append(pending.popleft().result())
+    finally:
+        executor.shutdown(wait=True)
+    _warn_failed_chunks(reports)
+    return reports
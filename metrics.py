@@ -0,0 +1,195 @@
+# Per-endpoint request metrics for SiteScan calls and feature layer operations
+#
+# Every SiteScan request and feature layer call is recorded with its latency, status,
+# bytes and retries. write_reports() writes them to SITESCAN_METRICS_FILE (JSON, or
+# Prometheus text format when the name ends in .prom) and, when SITESCAN_TRACE_FILE is
+# set, a span trace in Chrome trace event format.
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+report_path = os.environ.get("SITESCAN_METRICS_FILE")
+trace_path = os.environ.get("SITESCAN_TRACE_FILE")
+
+_lock = threading.Lock()
+_stats = {}
+_spans = []
+_started = time.time()
+
+# Function to turn a request path into an endpoint name, e.g. /projects/{id}/missions
+def endpoint_name(path):
+    path = path.split('?', 1)[0]
+    return re.sub(r'/(organizations|projects|missions)/[^/]+', r'/\1/{id}', path)
+
+# Function to get (creating if needed) the stats entry for a system and operation
+def _entry(system, operation):
+    key = (system, operation)
+    entry = _stats.get(key)
+    if entry is None:
+        entry = {'count': 0, 'seconds_sum': 0.0, 'buckets': [0] * (len(BUCKETS) + 1),
+                 'bytes': 0, 'retries': 0, 'cache_hits': 0, 'statuses': {}}
+        _stats[key] = entry
+    return entry
+
+# Function to record one completed call
+def record(system, operation, seconds, status='ok', bytes_received=0, retries=0):
+    with _lock:
+        entry = _entry(system, operation)
+        entry['count'] += 1
+        entry['seconds_sum'] += seconds
+        entry['buckets'][next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+        entry['bytes'] += bytes_received
+        entry['retries'] += retries
+        entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+        if trace_path:
+            _spans.append({'name': f"{system} {operation}", 'ph': 'X', 'pid': os.getpid(),
+                           'tid': threading.get_ident(), 'ts': int((time.time() - seconds) * 1e6),
+                           'dur': int(seconds * 1e6), 'args': {'status': str(status)}})
+
+# Function to count a retry that is not tied to a finished call (e.g. a token refresh)
+def record_retry(system, operation):
+    with _lock:
+        _entry(system, operation)['retries'] += 1
+
+# Function to count a response served from the local cache
+def record_cache_hit(system, operation):
+    with _lock:
+        _entry(system, operation)['cache_hits'] += 1
+
+# Context manager that times a block and records it, using the exception type as the status on failure
+@contextmanager
+def timed(system, operation):
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except Exception as error:
+        status = type(error).__name__
+        raise
+    finally:
+        record(system, operation, time.perf_counter() - started, status)
+
+# Function to clear all recorded metrics (e.g. between jobs in one process)
+def reset():
+    global _started
+    with _lock:
+        _stats.clear()
+        _spans.clear()
+        _started = time.time()
+
+# Function to return the recorded metrics as a JSON-friendly dict
+def snapshot():
+    with _lock:
+        operations = []
+        for (system, operation), entry in sorted(_stats.items()):
+            operations.append(dict(
+                entry,
+                system=system,
+                operation=operation,
+                statuses=dict(entry['statuses']),
+                buckets=dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'], entry['buckets']))
+            ))
+        return {'started': _started, 'finished': time.time(), 'operations': operations}
+
+# Function to render the metrics in Prometheus text exposition format
+def prometheus_text():
+    lines = []
+    data = snapshot()
+    for name, kind, help_text in (
+            ('requests_total', 'counter', 'Calls by status'),
+            ('request_seconds', 'histogram', 'Call latency in seconds'),
+            ('response_bytes_total', 'counter', 'Bytes received'),
+            ('retries_total', 'counter', 'Retried calls'),
+            ('cache_hits_total', 'counter', 'Responses served from the local cache')):
+        lines.append(f"# HELP sitescan_job_{name} {help_text}")
+        lines.append(f"# TYPE sitescan_job_{name} {kind}")
+        for entry in data['operations']:
+            labels = f'system="{entry["system"]}",operation="{entry["operation"]}"'
+            if name == 'requests_total':
+                for status, count in sorted(entry['statuses'].items()):
+                    lines.append(f'sitescan_job_{name}{{{labels},status="{status}"}} {count}')
+            elif name == 'request_seconds':
+                cumulative = 0
+                for bound, count in entry['buckets'].items():
+                    cumulative += count
+                    lines.append(f'sitescan_job_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'sitescan_job_{name}_sum{{{labels}}} {entry["seconds_sum"]:.6f}')
+                lines.append(f'sitescan_job_{name}_count{{{labels}}} {entry["count"]}')
+            else:
+                field = {'response_bytes_total': 'bytes', 'retries_total': 'retries', 'cache_hits_total': 'cache_hits'}[name]
+                lines.append(f'sitescan_job_{name}{{{labels}}} {entry[field]}')
+    return "\n".join(lines) + "\n"
+
+# Function to write the metrics report (and span trace) to the given or configured paths
+def write_reports(path=None, trace=None):
+    path = path or report_path
+    trace = trace or trace_path
+    if path:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as report_file:
+            if path.endswith('.prom'):
+                report_file.write(prometheus_text())
+            else:
+                json.dump(snapshot(), report_file, indent=2)
+        os.replace(temp_path, path)  # Atomic so textfile collectors never read a partial file
+        print(f"Wrote metrics report to {path}.")
+    if trace:
+        with _lock:
+            events = list(_spans)
+        with open(trace, 'w') as trace_file:
+            json.dump({'traceEvents': events}, trace_file)
+        print(f"Wrote span trace to {trace}.")
+
+
+class _InstrumentedManager:
+    def __init__(self, manager):
+        self._manager = manager
+
+    def add_to_definition(self, *args, **kwargs):
+        with timed('layer', 'add_to_definition'):
+            return self._manager.add_to_definition(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._manager, name)
+
+
+# Feature layer wrapper that records edit_features, delete_features, query, append,
+# add_to_definition and properties reads; everything else is passed straight through
+class InstrumentedLayer:
+    def __init__(self, feature_layer):
+        self._layer = feature_layer
+
+    @property
+    def properties(self):
+        with timed('layer', 'properties'):
+            return self._layer.properties
+
+    @property
+    def manager(self):
+        return _InstrumentedManager(self._layer.manager)
+
+    def edit_features(self, *args, **kwargs):
+        with timed('layer', 'edit_features'):
+            return self._layer.edit_features(*args, **kwargs)
+
+    def delete_features(self, *args, **kwargs):
+        with timed('layer', 'delete_features'):
+            return self._layer.delete_features(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        with timed('layer', 'query'):
+            return self._layer.query(*args, **kwargs)
+
+    def append(self, *args, **kwargs):
+        with timed('layer', 'append'):
+            return self._layer.append(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._layer, name)
@@ -0,0 +1,253 @@
+# Columnar catalog of every mission in an organization for org-wide analytics
+#
+# One bulk pass fetches the org's projects and missions into NumPy columns (ids, project index,
+# end time in ms since epoch, latitude/longitude), so mission counts, the most recent mission per
+# project and time-window filters are array operations instead of loops over lists of JSON dicts.
+# Catalogs save to a compressed .npz file so analyses can be re-run without re-fetching.
+# Jobs that write a catalog to a layer rebuild it once it is older than layer_catalog_max_age,
+# keeping the media locations already found; the summary below reuses a saved file as it is.
+#
+# Usage: python missionCatalog.py catalog.npz [--since 2024-01-01] [--until 2024-07-01]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from concurrentFetch import run_in_pool
+from sitescanClient import sitescan_get, iter_pages
+from timeUtils import mission_time_ms, parse_time_ms
+
+MISSION_URL = "https://sitescan.arcgis.com/projects/{project_id}/missions/{mission_id}"
+
+layer_catalog_max_age = 3600  # Seconds a saved catalog is reused for layer writes before SiteScan is fetched again
+
+
+class MissionCatalog:
+    def __init__(self, org_id, project_ids, project_names, mission_ids, mission_names,
+                 project_index, end_time, latitude=None, longitude=None, located=None, built_at=None):
+        count = len(mission_ids)
+        self.org_id = org_id
+        self.built_at = time.time() if built_at is None else float(built_at)  # When the missions were fetched
+        # One entry per project
+        self.project_ids = np.asarray(project_ids, dtype=str)
+        self.project_names = np.asarray(project_names, dtype=str)
+        # One entry per mission, grouped by project in SiteScan's mission order
+        self.mission_ids = np.asarray(mission_ids, dtype=str)
+        self.mission_names = np.asarray(mission_names, dtype=str)
+        self.project_index = np.asarray(project_index, dtype=np.int32)
+        self.end_time = np.asarray(end_time, dtype=np.int64)  # Milliseconds since epoch (UTC)
+        self.latitude = np.full(count, np.nan) if latitude is None else np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.full(count, np.nan) if longitude is None else np.asarray(longitude, dtype=np.float64)
+        self.located = np.zeros(count, dtype=bool) if located is None else np.asarray(located, dtype=bool)  # Media already looked up
+
+    def __len__(self):
+        return len(self.mission_ids)
+
+    # Function to count the missions in each project (zero for projects without missions)
+    def counts_per_project(self):
+        return np.bincount(self.project_index, minlength=len(self.project_ids))
+
+    # Function to get the row of each project's most recent mission, or -1 for projects without missions.
+    # Ties go to the mission listed first, as in timeUtils.most_recent_mission.
+    def latest_per_project(self):
+        latest = np.full(len(self.project_ids), -1, dtype=np.int64)
+        if not len(self):
+            return latest
+        rows = np.arange(len(self))
+        order = np.lexsort((-rows, self.end_time, self.project_index))
+        last_in_group = np.r_[self.project_index[order][1:] != self.project_index[order][:-1], True]
+        latest[self.project_index[order][last_in_group]] = order[last_in_group]
+        return latest
+
+    # Function to get each mission's 1-based position in its project's mission list
+    def mission_numbers(self):
+        starts = np.r_[0, np.cumsum(self.counts_per_project())[:-1]]
+        return np.arange(len(self)) - starts[self.project_index] + 1
+
+    # Function to get the rows of one project's missions
+    def project_rows(self, project_id):
+        matches = np.flatnonzero(self.project_ids == project_id)
+        if not len(matches):
+            raise KeyError(f"Project {project_id} is not in the catalog for organization {self.org_id}.")
+        return np.flatnonzero(self.project_index == matches[0])
+
+    # Function to get a mask of the missions whose end time falls in [start_ms, end_ms)
+    def window(self, start_ms=None, end_ms=None):
+        mask = np.ones(len(self), dtype=bool)
+        if start_ms is not None:
+            mask &= self.end_time >= start_ms
+        if end_ms is not None:
+            mask &= self.end_time < end_ms
+        return mask
+
+    # Function to get a catalog of only the missions selected by a mask or row array (projects are kept)
+    def subset(self, rows):
+        return MissionCatalog(
+            self.org_id, self.project_ids, self.project_names, self.mission_ids[rows], self.mission_names[rows],
+            self.project_index[rows], self.end_time[rows], self.latitude[rows], self.longitude[rows], self.located[rows],
+            self.built_at
+        )
+
+    # Function to look up the first media location of the given rows that have not been looked up yet
+    def fill_locations(self, api_token, rows, max_workers=1):
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[~self.located[rows]]
+        if not len(rows):
+            return
+        print(f"Retrieving media locations for {len(rows)} missions...")
+        locations = run_in_pool(
+            lambda row: first_media_location(api_token, self.mission_ids[row]),
+            rows.tolist(),
+            max_workers=max_workers
+        )
+        for row, (latitude, longitude) in zip(rows, locations):
+            self.latitude[row] = np.nan if latitude is None else latitude
+            self.longitude[row] = np.nan if longitude is None else longitude
+        self.located[rows] = True
+
+    # Function to build the feature for one mission row with the extra attributes given
+    def _feature(self, row, **extra):
+        project = self.project_index[row]
+        latitude = None if np.isnan(self.latitude[row]) else float(self.latitude[row])
+        longitude = None if np.isnan(self.longitude[row]) else float(self.longitude[row])
+        attributes = {
+            'project_id': str(self.project_ids[project]),
+            'project_name': str(self.project_names[project]),
+            'mission_id': str(self.mission_ids[row]),
+            'mission_name': str(self.mission_names[row]),
+            'end_time': int(self.end_time[row]),
+            'latitude': latitude,
+            'longitude': longitude,
+            'mission_url': MISSION_URL.format(project_id=self.project_ids[project], mission_id=self.mission_ids[row]),
+        }
+        attributes.update(extra)
+        return {
+            'attributes': attributes,
+            'geometry': {'x': longitude, 'y': latitude, 'spatialReference': {'wkid': 4326}}
+        }
+
+    # Function to build one feature per project for its most recent mission (XYLocationsProjectMissions layout)
+    def most_recent_features(self, api_token, max_workers=1):
+        latest = self.latest_per_project()
+        counts = self.counts_per_project()
+        projects = np.flatnonzero(latest >= 0)
+        self.fill_locations(api_token, latest[projects], max_workers=max_workers)
+        return [self._feature(latest[project], OrgID=self.org_id, ProjectCount=int(counts[project])) for project in projects]
+
+    # Function to build one feature per mission of a project (countMissionsInaProject layout)
+    def project_features(self, api_token, project_id, max_workers=1):
+        rows = self.project_rows(project_id)
+        numbers = self.mission_numbers()
+        self.fill_locations(api_token, rows, max_workers=max_workers)
+        return [self._feature(row, mission_count=int(numbers[row])) for row in rows]
+
+    # Function to copy the media locations found in an older catalog to the same missions here.
+    # Missions that had no photos then are left to be looked up again.
+    def copy_locations(self, other):
+        found = other.located & ~np.isnan(other.latitude)
+        previous = dict(zip(other.mission_ids[found].tolist(), np.flatnonzero(found).tolist()))
+        rows = [row for row, mission_id in enumerate(self.mission_ids.tolist()) if mission_id in previous]
+        old_rows = [previous[self.mission_ids[row]] for row in rows]
+        self.latitude[rows] = other.latitude[old_rows]
+        self.longitude[rows] = other.longitude[old_rows]
+        self.located[rows] = True
+
+    # Function to write the catalog to a compressed .npz file, replacing any earlier copy atomically
+    def save(self, path):
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            temp_path, org_id=np.asarray(self.org_id, dtype=str),
+            project_ids=self.project_ids, project_names=self.project_names,
+            mission_ids=self.mission_ids, mission_names=self.mission_names,
+            project_index=self.project_index, end_time=self.end_time,
+            latitude=self.latitude, longitude=self.longitude, located=self.located, built_at=self.built_at
+        )
+        os.replace(temp_path, path)
+        print(f"Saved catalog of {len(self)} missions to {path}.")
+
+
+# Function to read a catalog saved with MissionCatalog.save
+def load_catalog(path):
+    with np.load(path, allow_pickle=False) as data:
+        columns = {name: data[name] for name in data.files}
+    org_id = str(columns.pop('org_id'))
+    if 'built_at' not in columns:
+        columns['built_at'] = os.path.getmtime(path)  # Saved before build times were recorded
+    return MissionCatalog(org_id, **columns)
+
+# Function to get the first media location of a mission as (latitude, longitude), or (None, None)
+def first_media_location(api_token, mission_id):
+    first_media = next(iter_pages(api_token, f'/missions/{mission_id}/media', page_size=1), None)
+    coordinates = (first_media or {}).get('location', {}).get('coordinates', [])
+    if coordinates:
+        return coordinates[1], coordinates[0]
+    return None, None
+
+# Function to fetch every project and mission in an organization in one bulk pass
+def build_catalog(api_token, org_id, max_workers=1, use_cache=True):
+    print(f"Building mission catalog for organization ID {org_id}...")
+    projects = sitescan_get(api_token, f'/organizations/{org_id}/projects', use_cache=use_cache)
+    mission_lists = run_in_pool(
+        lambda project: sitescan_get(api_token, f"/projects/{project['id']}/missions", use_cache=use_cache),
+        projects,
+        max_workers=max_workers
+    )
+    mission_ids, mission_names, project_index, end_time = [], [], [], []
+    for index, missions in enumerate(mission_lists):
+        for mission in missions:
+            mission_ids.append(mission['id'])
+            mission_names.append(mission['name'])
+            project_index.append(index)
+            end_time.append(mission_time_ms(mission))
+    print(f"Catalog holds {len(mission_ids)} missions in {len(projects)} projects.")
+    return MissionCatalog(
+        org_id, [project['id'] for project in projects], [project['name'] for project in projects],
+        mission_ids, mission_names, project_index, end_time
+    )
+
+# Function to load the catalog at path if it exists for this organization, otherwise build it.
+# With max_age set, a catalog fetched more than that many seconds ago is rebuilt from live SiteScan data and
+# keeps only its media locations. Callers save it once media locations are filled in;
+# delete the file to force a fresh fetch.
+def load_or_build_catalog(api_token, org_id, path=None, max_age=None, max_workers=1):
+    if path and os.path.exists(path):
+        catalog = load_catalog(path)
+        age = time.time() - catalog.built_at
+        if org_id and catalog.org_id != org_id:
+            print(f"Catalog at {path} is for organization {catalog.org_id}; rebuilding.")
+        elif max_age is not None and age > max_age:
+            print(f"Catalog at {path} is {age / 60:.0f} minutes old; rebuilding it from SiteScan.")
+            fresh = build_catalog(api_token, org_id or catalog.org_id, max_workers=max_workers, use_cache=False)
+            fresh.copy_locations(catalog)
+            return fresh
+        else:
+            print(f"Loaded catalog of {len(catalog)} missions from {path}.")
+            return catalog
+    return build_catalog(api_token, org_id, max_workers=max_workers, use_cache=max_age is None)
+
+# Function to print mission counts and the most recent mission per project from a saved catalog
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a saved SiteScan mission catalog.")
+    parser.add_argument('path', help="Catalog .npz file")
+    parser.add_argument('--since', help="Only count missions ending at or after this date/time")
+    parser.add_argument('--until', help="Only count missions ending before this date/time")
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog(args.path)
+    mask = catalog.window(parse_time_ms(args.since) if args.since else None,
+                          parse_time_ms(args.until) if args.until else None)
+    catalog = catalog.subset(mask)
+    counts = catalog.counts_per_project()
+    latest = catalog.latest_per_project()
+    print(f"{'Project':40} {'Missions':>8}  Most recent mission")
+    for project in np.argsort(-counts, kind='stable'):
+        recent = catalog.mission_names[latest[project]] if latest[project] >= 0 else ''
+        print(f"{catalog.project_names[project][:40]:40} {counts[project]:8d}  {recent}")
+    print(f"{len(catalog)} missions in {int((counts > 0).sum())} of {len(counts)} projects.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
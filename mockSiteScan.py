@@ -0,0 +1,291 @@
+# Local stand-ins for the SiteScan API and an ArcGIS feature layer, used by benchmark.py
+#
+# run_mock_server serves a generated org of projects x missions x media with a fixed
+# per-request latency and an optional request rate cap above which it answers 429 with
+# Retry-After; FakeFeatureLayer keeps features in memory and records every call.
+
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/api/v2'
+
+# Function to generate a deterministic dataset of projects, missions, media and members
+def build_dataset(org_id='org-1', projects=10, missions=10, media=100, members=25):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    dataset = {'org': {'id': org_id, 'name': f"Benchmark org {org_id}"}, 'projects': [],
+               'missions': {}, 'media': {}, 'members': []}
+    for p in range(projects):
+        project_id = f"{org_id}-p{p}"
+        dataset['projects'].append({'id': project_id, 'name': f"Project {p}"})
+        dataset['missions'][project_id] = []
+        for m in range(missions):
+            mission_id = f"{project_id}-m{m}"
+            created = start + timedelta(days=p, hours=m)
+            dataset['missions'][project_id].append({
+                'id': mission_id,
+                'name': f"Mission {m}",
+                'created': created.isoformat().replace('+00:00', 'Z'),
+                'endTime': (created + timedelta(minutes=30)).isoformat().replace('+00:00', 'Z')
+            })
+            dataset['media'][mission_id] = [{
+                'id': f"{mission_id}-i{i}",
+                'url': f"https://example.invalid/{mission_id}/{i}.jpg",
+                'location': {'type': 'Point', 'coordinates': [-117.0 + p * 0.01 + i * 1e-5, 34.0 + m * 0.001 + i * 1e-5]}
+            } for i in range(media)]
+    dataset['members'] = [{'id': f"u{u}", 'email': f"user{u}@example.invalid"} for u in range(members)]
+    return dataset
+
+# Function to build the request handler class serving a dataset
+def _make_handler(dataset, latency, stats, lock, max_rps=None):
+    projects_by_id = {project['id']: project for project in dataset['projects']}
+    missions_by_id = {mission['id']: mission for missions in dataset['missions'].values() for mission in missions}
+    org_id = dataset['org']['id']
+    window = {'second': 0, 'count': 0}
+    routes = [
+        (rf'^/organizations/{re.escape(org_id)}$', lambda: dataset['org']),
+        (rf'^/organizations/{re.escape(org_id)}/projects$', lambda: dataset['projects']),
+        (rf'^/organizations/{re.escape(org_id)}/members$', lambda: dataset['members']),
+        (r'^/projects/([^/]+)/missions$', lambda project_id: dataset['missions'].get(project_id)),
+        (r'^/projects/([^/]+)$', lambda project_id: projects_by_id.get(project_id)),
+        (r'^/missions/([^/]+)/media$', lambda mission_id: dataset['media'].get(mission_id)),
+        (r'^/missions/([^/]+)$', lambda mission_id: missions_by_id.get(mission_id)),
+    ]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, data):
+            body = json.dumps(data).encode()
+            with lock:
+                stats['requests'] += 1
+                stats['bytes'] += len(body)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path == '/__stats':
+                with lock:
+                    body = dict(stats)
+                self.send_response(200)
+                payload = json.dumps(body).encode()
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            if max_rps:
+                with lock:
+                    second = int(time.monotonic())
+                    if window['second'] != second:
+                        window['second'], window['count'] = second, 0
+                    window['count'] += 1
+                    throttled = window['count'] > max_rps
+                    if throttled:
+                        stats['throttled'] += 1
+                if throttled:
+                    body = b'{"message": "Too many requests"}'
+                    self.send_response(429)
+                    self.send_header('Retry-After', '1')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+            time.sleep(latency)
+            path = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX) else parsed.path
+            for pattern, handler in routes:
+                match = re.match(pattern, path)
+                if match:
+                    data = handler(*match.groups())
+                    if data is None:
+                        self._send(404, {'message': 'Not found'})
+                    else:
+                        self._send(200, _apply_paging(data, parse_qs(parsed.query)))
+                    return
+            self._send(404, {'message': 'Not found'})
+
+        def do_POST(self):
+            time.sleep(latency)
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            if urlparse(self.path).path == f"{API_PREFIX}/auth/session/api":
+                self._send(200, {'token': 'benchmark-token'})
+            else:
+                self._send(404, {'message': 'Not found'})
+
+    return Handler
+
+# Function to slice list responses when limit/offset query parameters are given
+def _apply_paging(data, query):
+    if not isinstance(data, list) or 'limit' not in query:
+        return data
+    limit = int(query['limit'][0])
+    offset = int(query.get('offset', ['0'])[0])
+    return data[offset:offset + limit]
+
+# Function to start the mock SiteScan API on a background thread; returns (server, base_url)
+def run_mock_server(dataset, latency=0.0, port=0, max_rps=None):
+    stats = {'requests': 0, 'bytes': 0, 'throttled': 0}
+    server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(dataset, latency, stats, threading.Lock(), max_rps))
+    server.daemon_threads = True
+    server.stats = stats
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}{API_PREFIX}"
+
+# Function to serve a dataset until the process is stopped (for running the mock in a child process)
+def serve_forever(dataset, latency, port, ready, max_rps=None):
+    server, _ = run_mock_server(dataset, latency, port, max_rps)
+    ready.put(server.server_address[1])
+    threading.Event().wait()
+
+
+class _Namespace(dict):
+    __getattr__ = dict.__getitem__
+
+
+class _Feature:
+    def __init__(self, attributes, geometry):
+        self.attributes = attributes
+        self.geometry = geometry
+
+
+class _FeatureSet:
+    def __init__(self, features):
+        self.features = features
+
+
+class _Manager:
+    def __init__(self, layer):
+        self.layer = layer
+
+    def add_to_definition(self, definition):
+        self.layer.calls.append(('add_to_definition', len(definition.get('fields', []))))
+        self.layer.properties['fields'].extend(definition.get('fields', []))
+
+
+class _FakeItem:
+    def __init__(self, content, item_id, data):
+        self._content = content
+        self.id = item_id
+        self.data = data
+
+    def delete(self):
+        self._content.items.pop(self.id, None)
+        return True
+
+
+# Stand-in for gis.content that keeps uploaded files in memory, for the bulk write path
+class _FakeContent:
+    def __init__(self):
+        self.items = {}
+
+    def add(self, item_properties, data=None):
+        with open(data) as data_file:
+            item = _FakeItem(self, f"item{len(self.items) + 1}", json.load(data_file))
+        self.items[item.id] = item
+        return item
+
+
+# In-memory feature layer that records edit_features/delete_features/append calls
+class FakeFeatureLayer:
+    def __init__(self, fields=()):
+        self.properties = _Namespace(
+            objectIdField='OBJECTID',
+            fields=[{'name': 'OBJECTID', 'type': 'esriFieldTypeOID'}] + [{'name': name} for name in fields],
+            supportsAppend=True,
+            supportedAppendFormats='geojson'
+        )
+        self.manager = _Manager(self)
+        self._gis = _Namespace(content=_FakeContent())
+        self.features = {}
+        self.calls = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    # Function to test a feature against the simple where clauses the scripts use
+    def _matches(self, attributes, where):
+        if where in (None, '', '1=1'):
+            return True
+        match = re.match(r"^\s*(\w+)\s+IN\s*\((.*)\)\s*$", where)
+        if match:
+            values = [value.replace("''", "'") for value in re.findall(r"'((?:[^']|'')*)'", match.group(2))]
+            return str(attributes.get(match.group(1))) in values
+        match = re.match(r"^\s*(\w+)\s*=\s*'([^']*)'\s*$", where)
+        if not match:
+            raise ValueError(f"FakeFeatureLayer cannot evaluate where clause {where!r}")
+        return str(attributes.get(match.group(1))) == match.group(2)
+
+    def query(self, where="1=1", out_fields="*", return_geometry=True, return_ids_only=False, **kwargs):
+        with self._lock:
+            self.calls.append(('query', where))
+            if return_ids_only:
+                return {'objectIdFieldName': 'OBJECTID',
+                        'objectIds': [object_id for object_id, (attributes, _) in self.features.items()
+                                      if self._matches(attributes, where)]}
+            return _FeatureSet([_Feature(dict(attributes), dict(geometry or {}))
+                                for attributes, geometry in self.features.values()
+                                if self._matches(attributes, where)])
+
+    def delete_features(self, where=None, deletes=None):
+        with self._lock:
+            if deletes:
+                doomed = [object_id for object_id in map(int, str(deletes).split(',')) if object_id in self.features]
+            else:
+                doomed = [object_id for object_id, (attributes, _) in self.features.items()
+                          if self._matches(attributes, where)]
+            for object_id in doomed:
+                del self.features[object_id]
+            self.calls.append(('delete_features', len(doomed)))
+            return {'deleteResults': [{'objectId': object_id, 'success': True} for object_id in doomed]}
+
+    def edit_features(self, adds=None, updates=None, deletes=None, **kwargs):
+        with self._lock:
+            results = {'addResults': [], 'updateResults': [], 'deleteResults': []}
+            for feature in adds or []:
+                object_id = self._next_id
+                self._next_id += 1
+                attributes = dict(feature['attributes'], OBJECTID=object_id)
+                self.features[object_id] = (attributes, feature.get('geometry'))
+                results['addResults'].append({'objectId': object_id, 'success': True})
+            for feature in updates or []:
+                object_id = feature['attributes']['OBJECTID']
+                found = object_id in self.features
+                if found:
+                    self.features[object_id] = (dict(feature['attributes']), feature.get('geometry'))
+                results['updateResults'].append({'objectId': object_id, 'success': found})
+            delete_ids = [int(object_id) for object_id in str(deletes).split(',')] if deletes else []
+            for object_id in delete_ids:
+                found = self.features.pop(object_id, None) is not None
+                results['deleteResults'].append({'objectId': object_id, 'success': found})
+            self.calls.append(('edit_features', len(adds or []), len(updates or []), len(delete_ids)))
+            return results
+
+    def append(self, item_id=None, upload_format=None, field_mappings=None, **kwargs):
+        with self._lock:
+            collection = self._gis.content.items[item_id].data
+            names = {mapping['sourceName']: mapping['name'] for mapping in field_mappings or []}
+            for feature in collection['features']:
+                object_id = self._next_id
+                self._next_id += 1
+                attributes = {names.get(name, name): value for name, value in feature['properties'].items()}
+                attributes['OBJECTID'] = object_id
+                geometry = feature['geometry']
+                if geometry and geometry['type'] == 'Point':
+                    geometry = {'x': geometry['coordinates'][0], 'y': geometry['coordinates'][1]}
+                elif geometry:
+                    geometry = {'rings': [list(reversed(ring)) for ring in geometry['coordinates']]}
+                self.features[object_id] = (attributes, geometry)
+            self.calls.append(('append', len(collection['features'])))
+            return True
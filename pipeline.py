@@ -0,0 +1,107 @@
+# Producer/consumer helpers that overlap SiteScan fetches with feature layer writes
+#
+# Producers run on background threads and push features into a bounded queue; the caller
+# drains it (typically through layerWriter.write_features_streaming) while fetching goes on.
+# The bound keeps memory flat when the writer is slower than the fetchers.
+
+import queue
+import threading
+
+queue_size = 2000  # Features buffered between the fetchers and the writer
+
+_DONE = object()
+TICK = object()  # Yielded by background_iter(tick=...) whenever no item arrived for tick seconds
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+# Function to put an item on the queue, giving up if the consumer has stopped
+def _put(buffer, stop, item):
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# Function to yield from the queue until every producer is done, re-raising the first producer error.
+# With tick set, TICK is yielded each time tick seconds pass without an item.
+def _drain(buffer, stop, producers, threads, tick=None):
+    finished = 0
+    try:
+        while finished < producers:
+            try:
+                item = buffer.get(timeout=tick)
+            except queue.Empty:
+                yield TICK
+                continue
+            if item is _DONE:
+                finished += 1
+            elif isinstance(item, _Failure):
+                raise item.error
+            else:
+                yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+# Function to run func on every item with max_workers threads and yield the features as they
+# are produced (completion order, not input order). func may return a feature, a list of
+# features, or None. If any call raises, the other workers stop and the error is re-raised.
+def fan_out_iter(func, items, max_workers=1, size=None):
+    buffer = queue.Queue(maxsize=size or queue_size)
+    stop = threading.Event()
+    work = queue.Queue()
+    for item in items:
+        work.put(item)
+    workers = max(1, min(max_workers or 1, work.qsize()))
+
+    # Function run by each producer thread
+    def produce():
+        try:
+            while not stop.is_set():
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    break
+                result = func(item)
+                for feature in (result if isinstance(result, list) else [result]):
+                    if feature is not None and not _put(buffer, stop, feature):
+                        return
+        except Exception as error:
+            _put(buffer, stop, _Failure(error))
+        finally:
+            _put(buffer, stop, _DONE)
+
+    threads = [threading.Thread(target=produce, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return _drain(buffer, stop, workers, threads)
+
+# Function to consume an iterable on a background thread and yield its items through a
+# bounded queue, so the next pages are fetched while the caller is writing earlier ones.
+# With tick set, TICK is yielded whenever tick seconds pass without an item, so the caller
+# gets control back (e.g. to flush a partial chunk) while the producer is still working.
+def background_iter(iterable, size=None, tick=None):
+    buffer = queue.Queue(maxsize=size or queue_size)
+    stop = threading.Event()
+
+    # Function run by the producer thread
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(buffer, stop, item):
+                    return
+        except Exception as error:
+            _put(buffer, stop, _Failure(error))
+        finally:
+            _put(buffer, stop, _DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    return _drain(buffer, stop, 1, [thread], tick)
@@ -0,0 +1,75 @@
+# Adaptive token-bucket rate limiter shared by every SiteScan request in the process
+#
+# The rate ramps up slowly while requests succeed and is halved when SiteScan throttles
+# (429/503). A Retry-After from the server pauses all callers, not just the one that got it.
+# acquire() is for threads and acquire_async() for asyncio tasks; both share one bucket.
+
+import asyncio
+import os
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate=20.0, min_rate=0.5, max_rate=100.0, burst=10, increase=0.2, decrease=0.5):
+        self.rate = rate  # Requests per second currently allowed
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst  # Requests that may go out back to back after an idle period
+        self.increase = increase  # Added to the rate after every successful request
+        self.decrease = decrease  # Rate multiplier applied when throttled
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    # Function to take one token and return how long the caller must wait before sending
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = max(0.0, self._paused_until - now)
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+            return wait
+
+    # Function to block the calling thread until a request may be sent
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    # Function to wait in an asyncio task until a request may be sent
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # Function to ramp the rate up after a successful request
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    # Function to back off after a throttled request, pausing everyone for retry_after seconds if given.
+    # Requests already in flight tend to be throttled together, so the rate is only cut once per second.
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            print(f"SiteScan is throttling requests; rate lowered to {self.rate:.2f}/s.")
+
+
+# The limiter shared by all SiteScan calls; SITESCAN_RATE and SITESCAN_MAX_RATE set its starting and maximum rate
+limiter = AdaptiveRateLimiter(
+    rate=float(os.environ.get("SITESCAN_RATE", 20)),
+    max_rate=float(os.environ.get("SITESCAN_MAX_RATE", 100))
+)
@@ -0,0 +1,118 @@
+# Persistent SQLite cache for SiteScan GET responses and id -> name lookups
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+cache_path = os.environ.get(
+    "SITESCAN_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".sitescan", "cache.sqlite")
+)
+max_bytes = 256 * 1024 * 1024  # Least recently used responses are evicted above this size
+enabled = os.environ.get("SITESCAN_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+# Time to live in seconds for each endpoint, first matching pattern wins
+ENDPOINT_TTLS = [
+    (r'/organizations/[^/]+/projects$', 15 * 60),
+    (r'/organizations/[^/]+/members$', 5 * 60),
+    (r'/projects/[^/]+/missions$', 5 * 60),
+    (r'/missions/[^/]+/media$', 60 * 60),
+    (r'/(organizations|projects|missions)/[^/]+$', 60 * 60),
+]
+DEFAULT_TTL = 5 * 60
+
+_local = threading.local()
+
+# Function to open (or reuse) this thread's connection to the cache database
+def _connect():
+    connection = getattr(_local, 'connection', None)
+    if connection is None or getattr(_local, 'path', None) != cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        connection = sqlite3.connect(cache_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS names ("
+            "kind TEXT NOT NULL, id TEXT NOT NULL, name TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, id))"
+        )
+        connection.commit()
+        _local.connection = connection
+        _local.path = cache_path
+    return connection
+
+# Function to find the time to live for a request path
+def ttl_for(path):
+    path = path.split('?', 1)[0]
+    for pattern, ttl in ENDPOINT_TTLS:
+        if re.search(pattern, path):
+            return ttl
+    return DEFAULT_TTL
+
+# Function to return a cached response, or None if it is missing or expired
+def get(url, path):
+    connection = _connect()
+    row = connection.execute("SELECT body, stored_at FROM responses WHERE url = ?", (url,)).fetchone()
+    if row is None:
+        return None
+    body, stored_at = row
+    now = time.time()
+    if now - stored_at > ttl_for(path):
+        connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+        connection.commit()
+        return None
+    connection.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+    connection.commit()
+    return json.loads(body)
+
+# Function to store a response and evict least recently used entries over max_bytes
+def put(url, data):
+    body = json.dumps(data, separators=(',', ':'))
+    now = time.time()
+    connection = _connect()
+    connection.execute(
+        "INSERT OR REPLACE INTO responses (url, body, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+        (url, body, len(body), now, now)
+    )
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total > max_bytes:
+        evicted = 0
+        for evict_url, size in connection.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at ASC").fetchall():
+            if total <= max_bytes:
+                break
+            connection.execute("DELETE FROM responses WHERE url = ?", (evict_url,))
+            total -= size
+            evicted += 1
+        print(f"Evicted {evicted} cached responses to stay under {max_bytes} bytes.")
+    connection.commit()
+
+# Function to remember id -> name pairs from a list of SiteScan objects
+def remember_names(kind, items):
+    now = time.time()
+    rows = [(kind, str(item['id']), item.get('name'), now)
+            for item in items if isinstance(item, dict) and 'id' in item]
+    if rows:
+        connection = _connect()
+        connection.executemany("INSERT OR REPLACE INTO names (kind, id, name, updated_at) VALUES (?, ?, ?, ?)", rows)
+        connection.commit()
+
+# Function to look up a remembered name, or None if it is unknown
+def lookup_name(kind, item_id):
+    row = _connect().execute("SELECT name FROM names WHERE kind = ? AND id = ?", (kind, str(item_id))).fetchone()
+    return row[0] if row else None
+
+# Function to remove every cached response and name
+def clear():
+    connection = _connect()
+    connection.execute("DELETE FROM responses")
+    connection.execute("DELETE FROM names")
+    connection.commit()
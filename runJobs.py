@@ -0,0 +1,197 @@
+# Runs a batch of SiteScan -> ArcGIS jobs for many orgs across a process pool
+#
+# Usage: python runJobs.py jobs.json [--processes N] [--summary summary.json] [--metrics-dir DIR] [--resume] [--dry-run]
+#
+# jobs.json lists the jobs to run, with optional defaults applied to every job:
+# {
+#     "processes": 4,
+#     "defaults": {"write_mode": "upsert", "max_workers": 4, "pipeline": true},
+#     "jobs": [
+#         {"name": "acme members", "type": "member_count", "org_id": "...", "item_id": "..."},
+#         {"name": "acme latest", "type": "xy_locations", "org_id": "...", "item_id": "...", "incremental": true},
+#         {"name": "acme bridge", "type": "project_missions", "project_id": "...", "item_id": "..."},
+#         {"name": "acme tower", "type": "project_missions", "org_id": "...", "project_id": "...", "item_id": "...",
+#          "catalog_path": "acme.npz", "catalog_max_age": 3600}
+#     ]
+# }
+#
+# Credentials are never prompted for: ArcGIS uses ARCGIS_USERNAME/ARCGIS_PASSWORD (or ARCGIS_PROFILE) and
+# SiteScan uses the tokenManager cache (SITESCAN_EMAIL/SITESCAN_PASSWORD) unless a job sets api_token.
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from gisLogin import open_feature_layer
+from sitescanClient import get_project_name
+
+# Function to run the organization member count job
+def run_member_count(job, feature_layer):
+    from CountMembersInOrg import update_agol_feature_class
+    update_agol_feature_class(job.get('api_token', ''), job['org_id'], feature_layer,
+                              write_mode=job.get('write_mode', 'replace'),
+                              history=job.get('history', False))
+
+# Function to run the most recent mission per project job
+def run_xy_locations(job, feature_layer):
+    if job.get('catalog_path'):
+        from XYLocationsProjectMissions import get_most_recent_missions_from_catalog
+        get_most_recent_missions_from_catalog(job.get('api_token', ''), job['org_id'], feature_layer,
+                                              catalog_path=job['catalog_path'],
+                                              catalog_max_age=job.get('catalog_max_age'),
+                                              max_workers=job.get('max_workers', 1),
+                                              write_mode=job.get('write_mode', 'replace'))
+        return
+    from XYLocationsProjectMissions import get_most_recent_missions_in_org
+    get_most_recent_missions_in_org(job.get('api_token', ''), job['org_id'], feature_layer,
+                                    max_workers=job.get('max_workers', 1),
+                                    write_mode=job.get('write_mode', 'replace'),
+                                    incremental=job.get('incremental', False),
+                                    pipeline=job.get('pipeline', False),
+                                    resume=job.get('resume', False),
+                                    location=job.get('location', 'first'),
+                                    # Dry runs keep their own state so they never mark changes as already written
+                                    layer_key=f"{job['item_id']}-dry-run" if job.get('dry_run') else job['item_id'])
+
+# Function to run the per-project mission job
+def run_project_missions(job, feature_layer):
+    from countMissionsInaProject import add_mission_count_field_if_not_exists, get_most_recent_missions_in_project
+    api_token = job.get('api_token', '')
+    add_mission_count_field_if_not_exists(feature_layer)
+    if job.get('catalog_path'):
+        from countMissionsInaProject import get_missions_in_project_from_catalog
+        get_missions_in_project_from_catalog(api_token, job.get('org_id'), job['project_id'], feature_layer,
+                                             catalog_path=job['catalog_path'],
+                                             catalog_max_age=job.get('catalog_max_age'),
+                                             max_workers=job.get('max_workers', 1),
+                                             write_mode=job.get('write_mode', 'replace'))
+        return
+    project_name = job.get('project_name') or get_project_name(api_token, job['project_id'])
+    get_most_recent_missions_in_project(api_token, job['project_id'], project_name, feature_layer,
+                                        max_workers=job.get('max_workers', 1),
+                                        write_mode=job.get('write_mode', 'replace'),
+                                        pipeline=job.get('pipeline', False),
+                                        location=job.get('location', 'first'),
+                                        incremental=job.get('incremental', False))
+
+# Function to run the photo locations for one mission job
+def run_mission_photos(job, feature_layer):
+    if job.get('footprint'):
+        from getPhotoURLfromaMission import update_feature_layer_with_mission_footprint
+        update_feature_layer_with_mission_footprint(job.get('api_token', ''), job['project_id'], job['mission_id'], feature_layer,
+                                                    shape=job['footprint'], write_mode=job.get('write_mode', 'replace'))
+        return
+    from getPhotoURLfromaMission import update_feature_layer_with_mission_media
+    update_feature_layer_with_mission_media(job.get('api_token', ''), job['project_id'], job['mission_id'], feature_layer,
+                                            write_mode=job.get('write_mode', 'replace'),
+                                            pipeline=job.get('pipeline', False),
+                                            thin_cell_size=job.get('thin_cell_size'))
+
+JOB_TYPES = {
+    'member_count': run_member_count,
+    'xy_locations': run_xy_locations,
+    'project_missions': run_project_missions,
+    'mission_photos': run_mission_photos,
+}
+
+# Function to run one job in a worker process and return its summary.
+# With metrics_dir set, the job's metrics report is written there as <job name>.json (or .prom).
+def run_job(job, metrics_dir=None, metrics_format='json'):
+    summary = {'name': job.get('name'), 'type': job.get('type'), 'status': 'ok', 'seconds': 0.0, 'error': None}
+    metrics.reset()
+    started = time.monotonic()
+    try:
+        # Logs in (once per worker process) only when the job first touches its layer
+        feature_layer = open_feature_layer(job['item_id'], dry_run=job.get('dry_run', False), interactive=False)
+        JOB_TYPES[job['type']](job, feature_layer)
+    except Exception as error:
+        summary['status'] = 'failed'
+        summary['error'] = repr(error)
+    summary['seconds'] = round(time.monotonic() - started, 2)
+
+    # Totals from the metrics layer so slow SiteScan reads and slow layer writes stand out
+    operations = metrics.snapshot()['operations']
+    for system in ('sitescan', 'layer'):
+        entries = [entry for entry in operations if entry['system'] == system]
+        summary[f"{system}_calls"] = sum(entry['count'] for entry in entries)
+        summary[f"{system}_seconds"] = round(sum(entry['seconds_sum'] for entry in entries), 2)
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        file_name = re.sub(r'[^\w.-]+', '_', str(summary['name'])) + ('.prom' if metrics_format == 'prometheus' else '.json')
+        metrics.write_reports(path=os.path.join(metrics_dir, file_name))
+    return summary
+
+# Function to load the job list, applying defaults and checking each job's type and required fields
+def load_jobs(config_path):
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    required = {
+        'member_count': ('org_id',),
+        'xy_locations': ('org_id',),
+        'project_missions': ('project_id',),
+        'mission_photos': ('project_id', 'mission_id'),
+    }
+    jobs = []
+    for number, entry in enumerate(config.get('jobs', []), start=1):
+        job = dict(config.get('defaults', {}), **entry)
+        job.setdefault('name', f"job {number}")
+        if job.get('type') not in JOB_TYPES:
+            raise ValueError(f"{job['name']}: unknown job type {job.get('type')!r}, expected one of {sorted(JOB_TYPES)}.")
+        missing = [field for field in ('item_id',) + required[job['type']] if not job.get(field)]
+        if missing:
+            raise ValueError(f"{job['name']}: missing {', '.join(missing)}.")
+        jobs.append(job)
+    return config, jobs
+
+# Function to run every job across a process pool and return the summaries in job order
+def run_jobs(jobs, processes=4, metrics_dir=None, metrics_format='json'):
+    if processes <= 1:
+        return [run_job(job, metrics_dir, metrics_format) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(run_job, jobs, [metrics_dir] * len(jobs), [metrics_format] * len(jobs)))
+
+# Function to print the per-job summary table
+def print_summary(summaries):
+    print(f"{'Job':30} {'Type':18} {'Status':8} {'Seconds':>8} {'SiteScan':>14} {'Layer':>14}  Error")
+    for summary in summaries:
+        sitescan = f"{summary['sitescan_calls']}/{summary['sitescan_seconds']:.1f}s"
+        layer = f"{summary['layer_calls']}/{summary['layer_seconds']:.1f}s"
+        print(f"{str(summary['name'])[:30]:30} {summary['type']:18} {summary['status']:8} {summary['seconds']:8.2f} "
+              f"{sitescan:>14} {layer:>14}  {summary['error'] or ''}")
+    failed = sum(1 for summary in summaries if summary['status'] != 'ok')
+    print(f"{len(summaries) - failed} of {len(summaries)} jobs succeeded.")
+
+# Function to parse the command line and run the batch
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run SiteScan -> ArcGIS jobs for many orgs.")
+    parser.add_argument('config', help="JSON file listing the jobs to run")
+    parser.add_argument('--processes', type=int, help="Number of jobs run at once (default: config 'processes' or 4)")
+    parser.add_argument('--summary', help="Also write the per-job summary to this JSON file")
+    parser.add_argument('--metrics-dir', help="Write each job's metrics report into this directory")
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json')
+    parser.add_argument('--resume', action='store_true', help="Continue interrupted org scans from their checkpoint journals")
+    parser.add_argument('--dry-run', action='store_true', help="Fetch from SiteScan but skip the ArcGIS login and write nothing")
+    args = parser.parse_args(argv)
+
+    config, jobs = load_jobs(args.config)
+    for job in jobs:
+        if args.resume:
+            job['resume'] = True
+        if args.dry_run:
+            job['dry_run'] = True
+    processes = args.processes or config.get('processes', 4)
+    print(f"Running {len(jobs)} jobs with {processes} processes...")
+    summaries = run_jobs(jobs, processes, args.metrics_dir, args.metrics_format)
+    print_summary(summaries)
+    if args.summary:
+        with open(args.summary, 'w') as summary_file:
+            json.dump(summaries, summary_file, indent=2)
+    return 0 if all(summary['status'] == 'ok' for summary in summaries) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# Shared SiteScan HTTP client used by all the scripts
+
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import responseCache
+import tokenManager
+from rateLimiter import limiter
+
+SITESCAN_API = "https://sitescan-api.arcgis.com/api/v2"
+
+# Connection pool and timeout settings (seconds)
+pool_size = 16
+connect_timeout = 10
+read_timeout = 120
+
+# Retry settings for idempotent GETs
+max_retries = 5
+backoff_base = 1.0  # Seconds; the backoff ceiling doubles on every attempt
+backoff_max = 60.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+
+# Items requested per page from list endpoints that support limit/offset
+media_page_size = 500
+
+_session = None
+
+# List endpoints whose id -> name pairs are remembered for name lookups
+NAME_KINDS = [
+    (r'/organizations/[^/]+/projects$', 'project'),
+    (r'/projects/[^/]+/missions$', 'mission'),
+]
+
+# Function to build a keep-alive session with a sized connection pool
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+    return session
+
+# Function to get the shared session, creating it on first use
+def get_session():
+    global _session
+    if _session is None:
+        _session = _build_session()
+    return _session
+
+# Function to change the pool size and timeouts before the first request
+def configure(pool=None, connect=None, read=None, api_url=None):
+    global pool_size, connect_timeout, read_timeout, SITESCAN_API, _session
+    if pool is not None:
+        pool_size = pool
+    if connect is not None:
+        connect_timeout = connect
+    if read is not None:
+        read_timeout = read
+    if api_url is not None:
+        SITESCAN_API = api_url.rstrip('/')
+    if _session is not None:
+        _session.close()
+        _session = None
+
+# Function to send one authenticated GET request and record its latency, status and size
+def _get(url, token, params, retries=0):
+    endpoint = metrics.endpoint_name(url[len(SITESCAN_API):])
+    started = time.perf_counter()
+    try:
+        response = get_session().get(
+            url,
+            headers={'Authorization': f'Bearer {token}'},
+            params=params,
+            timeout=(connect_timeout, read_timeout)
+        )
+    except requests.RequestException as error:
+        metrics.record('sitescan', endpoint, time.perf_counter() - started, type(error).__name__, retries=retries)
+        raise
+    metrics.record('sitescan', endpoint, time.perf_counter() - started, response.status_code,
+                   len(response.content), retries=retries)
+    return response
+
+# Function to read a Retry-After header (seconds or an HTTP date) as seconds, or None
+def _retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Function to get a jittered exponential backoff delay for a retry attempt (0-based)
+def _backoff(attempt):
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+# Function to GET a SiteScan API path and return the decoded JSON.
+# Responses are served from the local cache while fresh unless use_cache is False.
+# An empty api_token uses the cached token from tokenManager; a 401 refreshes it and retries once.
+# Every request goes through the shared rate limiter; 429/5xx responses and connection
+# errors are retried up to max_retries times, honouring Retry-After when it is sent.
+def sitescan_get(api_token, path, params=None, use_cache=True):
+    url = f"{SITESCAN_API}{path}"
+    cache_key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+    use_cache = use_cache and responseCache.enabled
+    if use_cache:
+        cached = responseCache.get(cache_key, path)
+        if cached is not None:
+            metrics.record_cache_hit('sitescan', metrics.endpoint_name(path))
+            return cached
+
+    token = tokenManager.resolve(api_token)
+    refreshed = False
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            response = _get(url, token, params, retries=1 if attempt else 0)  # Token refreshes are counted below
+        except (requests.ConnectionError, requests.Timeout) as error:
+            if attempt >= max_retries:
+                raise
+            delay = _backoff(attempt)
+            print(f"SiteScan request for {path} failed ({type(error).__name__}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if response.status_code == 401 and not refreshed and tokenManager.has_credentials():
+            print("SiteScan API token was rejected, refreshing it and retrying...")
+            token = tokenManager.refresh_token(stale_token=token)
+            metrics.record_retry('sitescan', metrics.endpoint_name(path))
+            refreshed = True
+            continue
+        if response.status_code in THROTTLE_STATUSES:
+            retry_after = _retry_after_seconds(response)
+            limiter.on_throttle(retry_after)
+        if response.status_code in RETRY_STATUSES and attempt < max_retries:
+            if response.status_code in THROTTLE_STATUSES and retry_after is not None:
+                print(f"SiteScan returned {response.status_code} for {path}, retrying after {retry_after:.1f}s...")
+            else:
+                delay = _backoff(attempt)
+                print(f"SiteScan returned {response.status_code} for {path}, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+            attempt += 1
+            continue
+        if response.ok:
+            limiter.on_success()
+        break
+    response.raise_for_status()
+    data = response.json()
+
+    if responseCache.enabled:
+        if use_cache:
+            responseCache.put(cache_key, data)
+        if isinstance(data, list):
+            for pattern, kind in NAME_KINDS:
+                if re.search(pattern, path):
+                    responseCache.remember_names(kind, data)
+    return data
+
+# Function to yield the items of a list endpoint page by page using limit/offset.
+# Stop iterating early to skip the remaining pages. If the endpoint ignores the paging
+# parameters (returns more than a page, or the same page again) it is treated as unpaged:
+# a repeated page means the offset was ignored, so the list is fetched once without paging
+# and the items not yet yielded are yielded from it (none when it is just the repeated page).
+# Raises if the unpaged list is shorter than what was already paged, rather than return a truncated list.
+def iter_pages(api_token, path, page_size=None, use_cache=True):
+    page_size = page_size or media_page_size
+    offset = 0
+    first_id = None
+    while True:
+        page = sitescan_get(api_token, path, params={'limit': page_size, 'offset': offset}, use_cache=use_cache)
+        if not page:
+            return
+        if offset and isinstance(page[0], dict) and page[0].get('id') == first_id:
+            # Offset ignored: this page repeats the previous one
+            print(f"SiteScan ignored the offset for {path}; fetching the whole list instead.")
+            items = sitescan_get(api_token, path, use_cache=use_cache)
+            if not isinstance(items, list) or len(items) < offset:
+                # Fewer items than were already paged means the unpaged list is capped too
+                raise RuntimeError(f"SiteScan ignored the offset for {path} and capped the unpaged list; "
+                                   "refusing to return a truncated list.")
+            yield from items[offset:]
+            return
+        first_id = page[0].get('id') if isinstance(page[0], dict) else None
+        yield from page
+        if len(page) != page_size:
+            return  # Last page, or the whole list because paging is not supported
+        offset += page_size
+
+# Function to look up a name by id, fetching only the single object on a cache miss
+def _lookup_name(api_token, kind, path, item_id):
+    if responseCache.enabled:
+        name = responseCache.lookup_name(kind, item_id)
+        if name is not None:
+            return name
+    item = sitescan_get(api_token, path)
+    name = item.get('name')
+    if responseCache.enabled:
+        responseCache.remember_names(kind, [item])
+    return name
+
+# Function to get a project's name without downloading the org's project list
+def get_project_name(api_token, project_id):
+    return _lookup_name(api_token, 'project', f'/projects/{project_id}', project_id)
+
+# Function to get a mission's name without downloading the project's mission list
+def get_mission_name(api_token, mission_id):
+    return _lookup_name(api_token, 'mission', f'/missions/{mission_id}', mission_id)
+
+# Function to POST to a SiteScan API path and return the raw response
+def sitescan_post(path, **kwargs):
+    kwargs.setdefault('timeout', (connect_timeout, read_timeout))
+    limiter.acquire()
+    with metrics.timed('sitescan', f"POST {metrics.endpoint_name(path)}"):
+        return get_session().post(f"{SITESCAN_API}{path}", **kwargs)
@@ -0,0 +1,140 @@
+# Grid index over photo coordinates for thinning photo layers and building mission footprints
+#
+# GridIndex buckets latitude/longitude points into square cells of a given size in metres, so a
+# photo layer can keep one representative photo per cell instead of hundreds of near-duplicates.
+# Footprint accumulates a mission's photo locations in one pass and turns them into a centroid
+# point, bounding box or convex hull polygon, holding only the current hull rather than every point.
+
+import math
+
+METRES_PER_DEGREE = 111320.0  # Length of one degree of latitude
+MIN_EXTENT = 1e-6  # Degrees a zero-width bounding box is padded by so it stays a valid polygon
+FOOTPRINT_SHAPES = ('centroid', 'bbox', 'hull')
+
+
+class GridIndex:
+    def __init__(self, cell_size_m=25.0):
+        self.cell_size_m = cell_size_m
+        self.lat_step = cell_size_m / METRES_PER_DEGREE
+        self.cells = {}  # Cell key -> representative item
+
+    # Function to get the cell a point falls in; columns are sized for the latitude of the cell's row
+    def cell_key(self, latitude, longitude):
+        row = math.floor(latitude / self.lat_step)
+        row_latitude = (row + 0.5) * self.lat_step
+        lon_step = self.lat_step / max(math.cos(math.radians(row_latitude)), 1e-6)
+        return row, math.floor(longitude / lon_step)
+
+    # Function to add a point, keeping item as its cell's representative if the cell was empty.
+    # Returns True when the item became a representative.
+    def add(self, latitude, longitude, item=None):
+        key = self.cell_key(latitude, longitude)
+        if key in self.cells:
+            return False
+        self.cells[key] = item
+        return True
+
+    def __len__(self):
+        return len(self.cells)
+
+
+# Function to yield only the first item in each grid cell of cell_size_m metres.
+# location(item) returns the item's (latitude, longitude).
+def thin(items, cell_size_m, location):
+    index = GridIndex(cell_size_m)
+    for item in items:
+        latitude, longitude = location(item)
+        if index.add(latitude, longitude):
+            yield item
+
+
+# Function to compute the cross product of the vectors o->a and o->b
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+# Function to compute the convex hull of (x, y) points, counter-clockwise (Andrew's monotone chain)
+def convex_hull(points):
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+    lower = []
+    for point in points:
+        while len(lower) >= 2 and _cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+    upper = []
+    for point in reversed(points):
+        while len(upper) >= 2 and _cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+    return lower[:-1] + upper[:-1]
+
+
+class Footprint:
+    def __init__(self, hull_buffer=1000):
+        self.count = 0
+        self._sum_x = 0.0
+        self._sum_y = 0.0
+        self.min_x = self.min_y = math.inf
+        self.max_x = self.max_y = -math.inf
+        self._hull = []  # Hull of the points folded in so far
+        self._pending = []  # Points added since the hull was last updated
+        self.hull_buffer = hull_buffer
+
+    # Function to add one photo location
+    def add(self, latitude, longitude):
+        self.count += 1
+        self._sum_x += longitude
+        self._sum_y += latitude
+        self.min_x = min(self.min_x, longitude)
+        self.max_x = max(self.max_x, longitude)
+        self.min_y = min(self.min_y, latitude)
+        self.max_y = max(self.max_y, latitude)
+        self._pending.append((longitude, latitude))
+        if len(self._pending) >= self.hull_buffer:
+            self._fold()
+
+    # Function to fold the pending points into the hull so memory stays bounded
+    def _fold(self):
+        self._hull = convex_hull(self._hull + self._pending)
+        self._pending = []
+
+    # Function to get the mean photo location as (latitude, longitude), or (None, None) with no photos
+    def centroid(self):
+        if not self.count:
+            return None, None
+        return self._sum_y / self.count, self._sum_x / self.count
+
+    # Function to get the ArcGIS JSON geometry for shape ('centroid', 'bbox' or 'hull'), or None with no photos.
+    # Outer rings are clockwise as ArcGIS expects; a hull of fewer than three distinct points falls back to the bounding box.
+    def geometry(self, shape='hull'):
+        if shape not in FOOTPRINT_SHAPES:
+            raise ValueError(f"Unknown footprint shape '{shape}', expected one of {FOOTPRINT_SHAPES}.")
+        if not self.count:
+            return None
+        if shape == 'centroid':
+            latitude, longitude = self.centroid()
+            return {'x': longitude, 'y': latitude, 'spatialReference': {'wkid': 4326}}
+        ring = None
+        if shape == 'hull':
+            self._fold()
+            if len(self._hull) >= 3:
+                ring = list(reversed(self._hull))
+        if ring is None:
+            pad_x = MIN_EXTENT if self.max_x - self.min_x < MIN_EXTENT else 0.0
+            pad_y = MIN_EXTENT if self.max_y - self.min_y < MIN_EXTENT else 0.0
+            min_x, max_x = self.min_x - pad_x, self.max_x + pad_x
+            min_y, max_y = self.min_y - pad_y, self.max_y + pad_y
+            ring = [(min_x, min_y), (min_x, max_y), (max_x, max_y), (max_x, min_y)]
+        ring.append(ring[0])
+        return {'rings': [[list(point) for point in ring]], 'spatialReference': {'wkid': 4326}}
+
+
+# Function to build a Footprint from SiteScan media items (GeoJSON location coordinates) in one pass
+def media_footprint(media_items):
+    footprint = Footprint()
+    for media_item in media_items:
+        coordinates = media_item.get('location', {}).get('coordinates', [])
+        if coordinates:
+            footprint.add(coordinates[1], coordinates[0])
+    return footprint
@@ -0,0 +1,36 @@
+# Local state store for incremental syncs: the last processed mission per project, one file per org
+# (and per target layer, so two jobs for the same org writing to different layers keep separate state)
+
+import json
+import os
+
+state_dir = os.environ.get(
+    "SITESCAN_STATE_DIR",
+    os.path.join(os.path.expanduser("~"), ".sitescan", "state")
+)
+
+# Function to get the state file path for an organization, and the layer it is synced to when layer_key is given
+def state_path(org_id, layer_key=None):
+    name = f"{org_id}_{layer_key}" if layer_key else org_id
+    return os.path.join(state_dir, f"{name}.json")
+
+# Function to load the saved per-project state, or an empty dict on the first run
+def load_state(org_id, layer_key=None):
+    path = state_path(org_id, layer_key)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as state_file:
+        return json.load(state_file).get('projects', {})
+
+# Function to save the per-project state atomically so a crash never leaves a half-written file
+def save_state(org_id, projects, layer_key=None):
+    os.makedirs(state_dir, exist_ok=True)
+    path = state_path(org_id, layer_key)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as state_file:
+        json.dump({'org_id': org_id, 'projects': projects}, state_file, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+# Function to build the state entry recorded for a project
+def project_state(mission_id, end_time, mission_count):
+    return {'mission_id': mission_id, 'end_time': end_time, 'mission_count': mission_count}
@@ -0,0 +1,50 @@
+# Resuming an interrupted pipeline run in 'upsert' mode must leave unchanged features in place
+#
+# Runs against the mock SiteScan API and an in-memory layer: python -m pytest test_resume_pipeline.py
+
+import os
+
+import checkpoint
+import mockSiteScan
+import responseCache
+import sitescanClient
+import syncState
+import XYLocationsProjectMissions as xy
+from mockSiteScan import FakeFeatureLayer
+
+
+# Function to start the mock API for a dataset and point the client at it
+def start_mock(dataset):
+    server, _ = mockSiteScan.run_mock_server(dataset)
+    sitescanClient.configure(api_url=f"http://127.0.0.1:{server.server_address[1]}{mockSiteScan.API_PREFIX}")
+    return server
+
+
+def test_resumed_pipeline_upsert_keeps_unchanged_features(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, 'checkpoint_dir', str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(syncState, 'state_dir', str(tmp_path / "state"))
+    monkeypatch.setattr(responseCache, 'enabled', False)
+    dataset = mockSiteScan.build_dataset(projects=6, missions=2, media=2)
+    server = start_mock(dataset)
+    try:
+        layer = FakeFeatureLayer()
+        xy.get_most_recent_missions_in_org('token', 'org-1', layer, write_mode='upsert', pipeline=True)
+        assert len(layer.features) == 6
+
+        # The next run dies right after the first project's feature was written
+        project = dataset['projects'][0]
+        feature = xy.get_most_recent_mission_feature('token', 'org-1', project)
+        journal = checkpoint.Journal(checkpoint.journal_path("most_recent_missions_org-1"))
+        journal.record_project(project['id'], feature)
+        journal.written_recorder('project_id')([feature])
+        journal.close()
+
+        layer.calls.clear()
+        xy.get_most_recent_missions_in_org('token', 'org-1', layer, write_mode='upsert', pipeline=True, resume=True)
+
+        assert sorted(attributes['project_id'] for attributes, _ in layer.features.values()) == \
+            sorted(project['id'] for project in dataset['projects'])
+        assert not [call for call in layer.calls if call[0] in ('edit_features', 'delete_features')]
+        assert not os.path.exists(checkpoint.journal_path("most_recent_missions_org-1"))
+    finally:
+        server.shutdown()
@@ -0,0 +1,29 @@
+# Fast timestamp handling for SiteScan mission times
+
+from datetime import datetime, timezone
+
+# Function to convert an ISO-8601 timestamp to milliseconds since epoch (UTC).
+# datetime.fromisoformat handles SiteScan's usual format; dateutil is only the fallback.
+def parse_time_ms(value):
+    try:
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil.parser import parse  # Only imported for the rare timestamps fromisoformat rejects
+        parsed = parse(value)
+    return int(parsed.astimezone(timezone.utc).timestamp() * 1000)
+
+# Function to get a mission's end time (or created time if it has not ended) in milliseconds since epoch
+def mission_time_ms(mission):
+    return parse_time_ms(mission.get('endTime') or mission['created'])
+
+# Function to find the most recent mission, parsing each mission's time only once.
+# Returns (mission, end_time_ms), or (None, None) for an empty list.
+def most_recent_mission(missions):
+    best_mission, best_time = None, None
+    for mission in missions:
+        end_time = mission_time_ms(mission)
+        if best_time is None or end_time > best_time:
+            best_mission, best_time = mission, end_time
+    return best_mission, best_time
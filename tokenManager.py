@@ -0,0 +1,106 @@
+# Cached, auto-refreshing SiteScan API token shared by all the scripts and processes
+
+import json
+import os
+import threading
+
+import sitescanClient
+
+try:
+    import fcntl  # File locking is only available on POSIX; elsewhere refreshes are not serialized across processes
+except ImportError:
+    fcntl = None
+
+token_path = os.environ.get(
+    "SITESCAN_TOKEN_PATH",
+    os.path.join(os.path.expanduser("~"), ".sitescan", "token.json")
+)
+
+# Credentials for refreshing the token; set with set_credentials or the environment
+_email = os.environ.get("SITESCAN_EMAIL", "")
+_password = os.environ.get("SITESCAN_PASSWORD", "")
+
+_lock = threading.Lock()
+_token = None
+_stale_tokens = set()
+
+# Function to set the SiteScan login used when the token has to be refreshed
+def set_credentials(email, password):
+    global _email, _password
+    _email = email
+    _password = password
+
+# Function to check whether the token can be refreshed automatically
+def has_credentials():
+    return bool(_email and _password)
+
+# Function to read the cached token from disk, or None if there is none for this login
+def _read_token_file():
+    try:
+        with open(token_path) as token_file:
+            saved = json.load(token_file)
+    except (OSError, ValueError):
+        return None
+    if _email and saved.get('email') != _email:
+        return None
+    return saved.get('token')
+
+# Function to write the token to disk, readable only by the current user
+def _write_token_file(token):
+    os.makedirs(os.path.dirname(token_path), exist_ok=True)
+    temp_path = f"{token_path}.{os.getpid()}.tmp"
+    descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as token_file:
+        json.dump({'email': _email, 'token': token}, token_file)
+    os.replace(temp_path, token_path)
+
+# Function to log in to SiteScan and return a new API token
+def login():
+    if not has_credentials():
+        raise RuntimeError("No SiteScan credentials: set SITESCAN_EMAIL and SITESCAN_PASSWORD or call set_credentials().")
+    print("Requesting a new SiteScan API token...")
+    response = sitescanClient.sitescan_post("/auth/session/api", auth=(_email, _password))
+    response.raise_for_status()
+    return response.json()['token']
+
+# Function to get the current token, from memory, the token file, or a fresh login
+def get_token():
+    global _token
+    with _lock:
+        if _token is None:
+            _token = _read_token_file()
+        if _token is None:
+            _token = login()
+            _write_token_file(_token)
+        return _token
+
+# Function to replace a rejected token. If another thread or process already
+# refreshed it, that token is reused instead of logging in again (unless force is set).
+def refresh_token(stale_token=None, force=False):
+    global _token
+    with _lock:
+        if stale_token:
+            _stale_tokens.add(stale_token)
+        lock_file = None
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(token_path), exist_ok=True)
+            lock_file = open(f"{token_path}.lock", 'w')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            saved = _read_token_file()
+            if saved and saved not in _stale_tokens and not force:
+                _token = saved
+            else:
+                _token = login()
+                _write_token_file(_token)
+            return _token
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+# Function to pick the token to send: the caller's own token unless it is empty or has been rejected
+def resolve(api_token):
+    if not api_token or api_token in _stale_tokens:
+        return get_token()
+    return api_token
@@ -0,0 +1,253 @@
+# Long-running watch mode: polls SiteScan on an interval and pushes only what changed
+#
+# Usage: python watchDaemon.py jobs.json [--interval 300] [--jitter 0.1] [--status-file PATH]
+#                              [--status-port 8080] [--status-host 127.0.0.1] [--dry-run] [--once]
+#
+# Takes the same jobs.json as runJobs.py, and any job may set its own "interval" in seconds.
+# The process keeps its SiteScan HTTP session, API token and ArcGIS login warm between polls,
+# and each poll cheaply checks whether a job's source has changed before running it:
+#   xy_locations      always runs incrementally, so only projects with new or updated missions are written
+#   project_missions  runs incrementally when the project's mission list changes, looking up only new or changed missions
+#   mission_photos    runs when the mission record changes
+# Every job except member_count is written in 'upsert' mode, so only the features that differ are sent.
+#   member_count      runs on every poll
+# SIGINT/SIGTERM let the job in progress finish and then exit cleanly. The status file (and the
+# optional /status and /health HTTP endpoints) show each job's last run, result and next run.
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+import responseCache
+from gisLogin import open_feature_layer
+from runJobs import JOB_TYPES, load_jobs
+from sitescanClient import sitescan_get
+
+default_interval = 300  # Seconds between polls of a job
+default_jitter = 0.1  # Each wait is randomly up to this fraction shorter or longer
+max_backoff = 8  # A failing job waits up to this many intervals before it is tried again
+heartbeat = 30  # Seconds between status updates while idle
+health_timeout = 900  # /health fails if the scheduler has not checked in for this long
+status_host = '127.0.0.1'  # The status endpoints show job details and errors, so they only listen locally by default
+
+status_path = os.environ.get(
+    "SITESCAN_WATCH_STATUS",
+    os.path.join(os.path.expanduser("~"), ".sitescan", "watch_status.json")
+)
+
+# Function to spread a wait by +/- jitter so jobs and daemons do not poll in lockstep
+def jittered(seconds, jitter):
+    return seconds * random.uniform(1 - jitter, 1 + jitter)
+
+# Function to get a fingerprint of the SiteScan data a job is built from, or None if the job
+# should run on every poll. Fetched uncached so the comparison always sees the live data.
+def source_fingerprint(job):
+    api_token = job.get('api_token', '')
+    if job['type'] == 'project_missions':
+        data = sitescan_get(api_token, f"/projects/{job['project_id']}/missions", use_cache=False)
+    elif job['type'] == 'mission_photos':
+        data = sitescan_get(api_token, f"/missions/{job['mission_id']}", use_cache=False)
+    else:
+        return None
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+class Watcher:
+    def __init__(self, jobs, interval=default_interval, jitter=default_jitter, status_file=None, dry_run=False):
+        self.jobs = jobs
+        self.interval = interval
+        self.jitter = jitter
+        self.status_file = status_file or status_path
+        self.dry_run = dry_run
+        self.stop_event = threading.Event()
+        self.started = time.time()
+        self.last_heartbeat = time.time()
+        self.running = None
+        self._layers = {}  # Item ID -> layer, so each layer is looked up once per process
+        self.states = {}
+        for job in jobs:
+            self.states[job['name']] = {
+                'type': job['type'], 'runs': 0, 'failures': 0, 'last_run': None, 'last_status': None,
+                'last_error': None, 'last_seconds': None, 'fingerprint': None,
+                # The first polls are spread over the jitter window instead of all firing at once
+                'next_run': time.time() + random.uniform(0, self.jitter * self._job_interval(job))
+            }
+
+    # Function to get a job's own interval, or the daemon's
+    def _job_interval(self, job):
+        return job.get('interval', self.interval)
+
+    # Function to get the layer for an item, opening it (lazily, without logging in yet) on first use
+    def _layer(self, item_id):
+        if item_id not in self._layers:
+            self._layers[item_id] = open_feature_layer(item_id, dry_run=self.dry_run, interactive=False)
+        return self._layers[item_id]
+
+    # Function to poll one job: skip it if its source is unchanged, otherwise run it on the warm layer
+    def run_job(self, job):
+        state = self.states[job['name']]
+        started = time.monotonic()
+        self.running = job['name']
+        try:
+            fingerprint = source_fingerprint(job)
+            if fingerprint is not None and fingerprint == state['fingerprint']:
+                state['last_status'] = 'unchanged'
+            else:
+                if job['type'] in ('xy_locations', 'project_missions'):
+                    # Only new or changed missions are looked up, and only features that differ are written.
+                    # A saved catalog would hide the changes, so the jobs always read SiteScan directly.
+                    job = dict(job, incremental=True, catalog_path=None, dry_run=self.dry_run or job.get('dry_run', False))
+                if job['type'] != 'member_count':
+                    job = dict(job, write_mode='upsert')
+                JOB_TYPES[job['type']](job, self._layer(job['item_id']))
+                state['fingerprint'] = fingerprint
+                state['last_status'] = 'ok'
+                state['runs'] += 1
+            state['failures'] = 0
+            state['last_error'] = None
+        except Exception as error:
+            state['failures'] += 1
+            state['last_status'] = 'failed'
+            state['last_error'] = repr(error)
+            print(f"Job {job['name']} failed: {error!r}")
+        finally:
+            self.running = None
+        state['last_run'] = time.time()
+        state['last_seconds'] = round(time.monotonic() - started, 2)
+        backoff = min(2 ** state['failures'], max_backoff) if state['failures'] else 1
+        state['next_run'] = time.time() + jittered(self._job_interval(job) * backoff, self.jitter)
+
+    # Function to build the status report
+    def status(self):
+        jobs = {name: {key: value for key, value in state.items() if key != 'fingerprint'}
+                for name, state in self.states.items()}
+        return {
+            'pid': os.getpid(),
+            'started': self.started,
+            'updated': time.time(),
+            'heartbeat': self.last_heartbeat,
+            'healthy': self.healthy(),
+            'stopping': self.stop_event.is_set(),
+            'running': self.running,
+            'jobs': jobs,
+        }
+
+    # Function to check that the scheduler loop is still checking in
+    def healthy(self):
+        return time.time() - self.last_heartbeat < health_timeout
+
+    # Function to write the status file atomically
+    def write_status(self):
+        os.makedirs(os.path.dirname(self.status_file) or '.', exist_ok=True)
+        temp_path = f"{self.status_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as status_file:
+            json.dump(self.status(), status_file, indent=1)
+        os.replace(temp_path, self.status_file)
+
+    # Function to run due jobs until stop() is called, sleeping between them.
+    # With once=True every job is polled a single time and the loop returns.
+    def run(self, once=False):
+        print(f"Watching {len(self.jobs)} jobs every {self.interval}s (status: {self.status_file}).")
+        if once:
+            for job in self.jobs:
+                self.run_job(job)
+            self.write_status()
+            return
+        while not self.stop_event.is_set():
+            self.last_heartbeat = time.time()
+            due = [job for job in self.jobs if self.states[job['name']]['next_run'] <= time.time()]
+            for job in sorted(due, key=lambda job: self.states[job['name']]['next_run']):
+                if self.stop_event.is_set():
+                    break
+                self.run_job(job)
+                self.last_heartbeat = time.time()
+                self.write_status()
+            self.write_status()
+            next_run = min(state['next_run'] for state in self.states.values())
+            self.stop_event.wait(max(0.0, min(next_run - time.time(), heartbeat)))
+        print("Watcher stopped.")
+        self.write_status()
+
+    # Function to ask the loop to exit once the job in progress has finished
+    def stop(self):
+        self.stop_event.set()
+
+
+# Function to serve /status (the status report) and /health (200 or 503) on a background thread
+def serve_status(watcher, port, host=None):
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/health':
+                healthy = watcher.healthy()
+                body = b'ok\n' if healthy else b'stale\n'
+                self.send_response(200 if healthy else 503)
+                self.send_header('Content-Type', 'text/plain')
+            elif self.path == '/status':
+                body = json.dumps(watcher.status(), indent=1).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+            else:
+                body = b'not found\n'
+                self.send_response(404)
+                self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep health checks out of the job output
+
+    server = ThreadingHTTPServer((host or status_host, port), StatusHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Status endpoint listening on {server.server_address[0]}:{server.server_address[1]} (/status, /health).")
+    return server
+
+# Function to parse the command line and watch until stopped
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll SiteScan and keep ArcGIS layers up to date.")
+    parser.add_argument('config', help="JSON file listing the jobs to watch (same format as runJobs.py)")
+    parser.add_argument('--interval', type=float, help=f"Seconds between polls (default: config 'interval' or {default_interval})")
+    parser.add_argument('--jitter', type=float, default=default_jitter, help="Fraction each wait is randomly varied by")
+    parser.add_argument('--status-file', help=f"Where to write the status report (default: {status_path})")
+    parser.add_argument('--status-port', type=int, help="Also serve /status and /health on this port")
+    parser.add_argument('--status-host', default=status_host,
+                        help=f"Address the status endpoints listen on (default: {status_host}; 0.0.0.0 for every interface)")
+    parser.add_argument('--dry-run', action='store_true', help="Fetch from SiteScan but skip the ArcGIS login and write nothing")
+    parser.add_argument('--once', action='store_true', help="Poll every job once and exit")
+    args = parser.parse_args(argv)
+
+    config, jobs = load_jobs(args.config)
+    # Cached responses would hide the very changes being watched for
+    responseCache.enabled = False
+    watcher = Watcher(jobs, interval=args.interval or config.get('interval', default_interval), jitter=args.jitter,
+                      status_file=args.status_file, dry_run=args.dry_run)
+
+    # Function to stop the loop on SIGINT/SIGTERM
+    def handle_signal(signum, frame):
+        print(f"Received signal {signum}; stopping after the current job...")
+        watcher.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    server = serve_status(watcher, args.status_port, args.status_host) if args.status_port is not None else None
+    try:
+        watcher.run(once=args.once)
+    finally:
+        if server is not None:
+            server.shutdown()
+        # Write the metrics report when SITESCAN_METRICS_FILE is set
+        metrics.write_reports()
+    failed = [name for name, state in watcher.states.items() if state['last_status'] == 'failed']
+    return 1 if args.once and failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())